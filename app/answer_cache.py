@@ -0,0 +1,129 @@
+# app/answer_cache.py
+
+import os
+import time
+import threading
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+# Final-answer cache keyed by query embedding. A lookup hits when a cached
+# question in the same index has cosine similarity >= ANSWER_CACHE_THRESHOLD
+# with the new one, so "LVT for healthcare" can answer "healthcare LVT
+# options" without search, DB or GPT calls. Entries carry the catalog version
+# they were built from, and invalidate() drops everything when the Crest cache
+# or the products table is refreshed.
+#
+# Questions that differ only by a SKU or style code embed almost identically,
+# so similarity alone could answer one product's question with another's.
+# Callers pass a key naming the products a question asks about (catalog
+# terms and code-like tokens); a hit also needs the same key.
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))  # per index
+
+
+class _IndexEntries:
+    def __init__(self, capacity, dim):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.answers = [None] * capacity
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.versions = [None] * capacity
+        self.keys = [None] * capacity
+
+
+class AnswerCache:
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, maxsize=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._indexes = {}  # index_name -> _IndexEntries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, index_name, vector, version=None, key=None):
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            entries = self._indexes.get(index_name)
+            if entries is None or entries.vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            # Expired or empty slots can never win
+            scores = entries.vectors @ query
+            stale = entries.expires <= now
+            if version is not None:
+                stale |= np.array([v != version for v in entries.versions])
+            stale |= np.array([k != key for k in entries.keys])
+            scores[stale] = -1.0
+
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entries.last_used[best] = now
+            self.hits += 1
+            return entries.answers[best]
+
+    def set(self, index_name, vector, answer, version=None, key=None):
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            entries = self._indexes.get(index_name)
+            if entries is None or entries.vectors.shape[1] != query.shape[0]:
+                entries = _IndexEntries(self.maxsize, query.shape[0])
+                self._indexes[index_name] = entries
+
+            # Reuse an expired slot first, otherwise evict the least recently used
+            free = np.flatnonzero(entries.expires <= now)
+            if free.size:
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(entries.last_used))
+                self.evictions += 1
+
+            entries.vectors[slot] = query
+            entries.answers[slot] = answer
+            entries.expires[slot] = now + self.ttl
+            entries.last_used[slot] = now
+            entries.versions[slot] = version
+            entries.keys[slot] = key
+
+    def invalidate(self, index_name=None):
+        with self._lock:
+            if index_name is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(index_name, None)
+            self.invalidations += 1
+
+    def stats(self):
+        now = time.time()
+        lookups = self.hits + self.misses
+        return {
+            "entries": {name: int((e.expires > now).sum()) for name, e in self._indexes.items()},
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+answer_cache = AnswerCache()
@@ -1,9 +1,13 @@
 # app/azure_search.py
 
 import os
-import json
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from app.search_clients import get_search_client, get_async_search_client
+from app.batching import (
+    size_capped_batches, is_transient, backoff_delay, BatchResult, BatchReport,
+    RETRY_MAX_ATTEMPTS, TRANSIENT_STATUS_CODES,
+)
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -12,30 +16,112 @@ AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
 # AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME")
 AZURE_SEARCH_API_VERSION = os.getenv("AZURE_SEARCH_API_VERSION")
 
+# Azure caps an indexing request at 1000 documents / 16 MB; stay well under
+UPLOAD_BATCH_MAX_DOCS = int(os.getenv("UPLOAD_BATCH_MAX_DOCS", "500"))
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_PARALLELISM = int(os.getenv("UPLOAD_PARALLELISM", "4"))
+
+
 # === Upload Embeddings ===
-def upload_documents_to_search(index_name, pdf_name, texts, vectors, metadata):
-    credential = AzureKeyCredential(AZURE_SEARCH_KEY)
-    search_client = SearchClient(endpoint=AZURE_SEARCH_ENDPOINT, index_name=index_name, credential=credential)
-
-    documents = []
-    for i in range(len(texts)):
-        documents.append({
-            "id": f"{pdf_name}-{i}",
-            "content": texts[i],
-            "embedding": vectors[i].tolist(),
-            "metadata": json.dumps(metadata[i]) if i < len(metadata) else "{}",
-            "surface_type": metadata[i].get("surface_type", index_name),
-            "collection_name": metadata[i].get("collection_name", ""),
-            "product_type": metadata[i].get("product_type", "")
-        })
-
-    result = search_client.upload_documents(documents)
-    print(f"Uploaded {len(result)} documents to Azure Cognitive Search.")
+def upload_batch(search_client, result, documents):
+    # Uploads one batch; retries the whole request on transient errors and
+    # only the rejected documents on per-document 429/503-style failures
+    pending = documents
+    started = time.perf_counter()
+    while pending:
+        result.attempts += 1
+        try:
+            outcomes = search_client.upload_documents(pending)
+        except Exception as e:
+            result.errors.append(str(e))
+            if result.attempts < RETRY_MAX_ATTEMPTS and is_transient(e):
+                time.sleep(backoff_delay(result.attempts))
+                continue
+            result.failed += len(pending)
+            result.failed_ids.extend(doc["id"] for doc in pending)
+            break
+
+        retry_ids = set()
+        for outcome in outcomes:
+            if outcome.succeeded:
+                result.succeeded += 1
+            elif outcome.status_code in TRANSIENT_STATUS_CODES and result.attempts < RETRY_MAX_ATTEMPTS:
+                retry_ids.add(outcome.key)
+            else:
+                result.failed += 1
+                result.failed_ids.append(outcome.key)
+                result.errors.append(f"{outcome.key}: {outcome.error_message}")
+        pending = [doc for doc in pending if doc["id"] in retry_ids]
+        if pending:
+            time.sleep(backoff_delay(result.attempts))
+    result.duration_ms = (time.perf_counter() - started) * 1000
+    return result
+
+
+def upload_search_documents(index_name, documents, max_docs=UPLOAD_BATCH_MAX_DOCS,
+                            max_bytes=UPLOAD_BATCH_MAX_BYTES, parallelism=UPLOAD_PARALLELISM):
+    # documents may be a generator; at most `parallelism` batches are built
+    # and in flight at once
+    search_client = get_search_client(index_name)
+    report = BatchReport()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        futures, in_flight = [], set()
+        for number, (batch, size_bytes) in enumerate(size_capped_batches(documents, max_docs, max_bytes)):
+            if len(in_flight) >= parallelism:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            result = BatchResult(number, len(batch), size_bytes)
+            report.add(result)
+            future = pool.submit(upload_batch, search_client, result, batch)
+            futures.append(future)
+            in_flight.add(future)
+        for future in futures:
+            future.result()
+    report.elapsed_ms = (time.perf_counter() - started) * 1000
+    print(
+        f"Uploaded {report.succeeded} documents to Azure Cognitive Search "
+        f"in {len(report.batches)} batches ({report.failed} failed)."
+    )
+    return report
+
+
+def delete_search_documents(index_name, ids):
+    if not ids:
+        return []
+    search_client = get_search_client(index_name)
+    return search_client.delete_documents([{"id": doc_id} for doc_id in ids])
 
 
 # === Vector Search from Azure Search ===
-def search_similar_content(query_vector, index_name, top_k=10):
-    credential = AzureKeyCredential(AZURE_SEARCH_KEY)
-    search_client = SearchClient(AZURE_SEARCH_ENDPOINT, index_name, credential)
+def search_similar_documents(query_vector, index_name, top_k=10):
+    search_client = get_search_client(index_name)
     results = search_client.search(search_text=None, vector_queries=[query_vector], select=["id", "content"], top=top_k)
-    return [result["content"] for result in results]
\ No newline at end of file
+    return [{"id": result["id"], "content": result["content"]} for result in results]
+
+
+async def asearch_similar_documents(query_vector, index_name, top_k=10):
+    search_client = get_async_search_client(index_name)
+    results = await search_client.search(search_text=None, vector_queries=[query_vector], select=["id", "content"], top=top_k)
+    return [{"id": result["id"], "content": result["content"]} async for result in results]
+
+
+# === Hybrid Search from Azure Search ===
+# One request: the service runs the BM25 and vector queries and fuses them
+# with its own RRF. k_nearest_neighbors on query_vector sets how many vector
+# hits take part in the fusion.
+def hybrid_search_documents(query_text, query_vector, index_name, top_k=10):
+    search_client = get_search_client(index_name)
+    results = search_client.search(
+        search_text=query_text, search_fields=["content"], vector_queries=[query_vector],
+        select=["id", "content"], top=top_k,
+    )
+    return [{"id": result["id"], "content": result["content"]} for result in results]
+
+
+async def ahybrid_search_documents(query_text, query_vector, index_name, top_k=10):
+    search_client = get_async_search_client(index_name)
+    results = await search_client.search(
+        search_text=query_text, search_fields=["content"], vector_queries=[query_vector],
+        select=["id", "content"], top=top_k,
+    )
+    return [{"id": result["id"], "content": result["content"]} async for result in results]
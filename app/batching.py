@@ -0,0 +1,162 @@
+# app/batching.py
+
+import os
+import json
+import time
+import random
+import threading
+import requests
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shared helpers for pushing large document sets to remote services:
+# size-capped batching, retry with exponential backoff + jitter for
+# transient errors, and a per-batch report that ingestion endpoints return.
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+
+# 409 / 422 are payload or conflict errors for Search and OpenAI: not retried
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+PAYLOAD_STATUS_CODES = {400, 413}
+PAYLOAD_ERROR_MARKERS = ("context length", "maximum context", "too many tokens", "token limit")
+
+
+# Upper bound on one float in a serialized vector: the longest float repr
+# ("-1.2345678918743134e-05", 23 chars) plus the ", " separator
+JSON_FLOAT_BYTES = 25
+
+
+def json_size(document):
+    # Upper bound on the document's serialized size without serializing the
+    # vectors (the SDK serializes the request again anyway); other fields
+    # are small and measured exactly
+    size = 2
+    for key, value in document.items():
+        if isinstance(value, list) and value and isinstance(value[0], float):
+            value_size = 2 + len(value) * JSON_FLOAT_BYTES
+        else:
+            value_size = len(json.dumps(value).encode("utf-8"))
+        size += len(json.dumps(key)) + 2 + value_size + 2
+    return size
+
+
+def size_capped_batches(items, max_count, max_bytes, size=json_size):
+    # Yields (batch, batch bytes); an item bigger than max_bytes goes alone
+    batch, batch_bytes = [], 0
+    for item in items:
+        item_bytes = size(item)
+        if batch and (len(batch) >= max_count or batch_bytes + item_bytes > max_bytes):
+            yield batch, batch_bytes
+            batch, batch_bytes = [], 0
+        batch.append(item)
+        batch_bytes += item_bytes
+    if batch:
+        yield batch, batch_bytes
+
+
+def status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(error, HttpResponseError) and error.response is not None:
+        status = error.response.status_code
+    return status
+
+
+def is_transient(error):
+    if isinstance(error, (ServiceRequestError, ServiceResponseError, requests.ConnectionError, requests.Timeout,
+                          ConnectionError, TimeoutError)):
+        return True
+    return status_code(error) in TRANSIENT_STATUS_CODES
+
+
+def is_payload_error(error):
+    # The request itself is bad (too many tokens, an input the model rejects):
+    # sending less may succeed, unlike throttling or an outage
+    status = status_code(error)
+    if status in PAYLOAD_STATUS_CODES:
+        return True
+    message = str(error).lower()
+    return status is None and any(marker in message for marker in PAYLOAD_ERROR_MARKERS)
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    # Full jitter: uniform in [0, min(cap, base * 2^(attempt-1))]
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def call_with_retry(func, *args, attempts=RETRY_MAX_ATTEMPTS, retry_if=is_transient, on_retry=None, **kwargs):
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts or not retry_if(e):
+                raise
+            delay = backoff_delay(attempt)
+            if on_retry:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+
+
+class BatchResult:
+    # size is in `unit`: serialized bytes for uploads, tokens for embeddings
+    def __init__(self, batch, documents, size, unit="bytes"):
+        self.batch = batch
+        self.documents = documents
+        self.size = size
+        self.unit = unit
+        self.attempts = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.failed_ids = []
+        self.errors = []
+        self.duration_ms = 0.0
+
+    def to_dict(self):
+        return {
+            "batch": self.batch,
+            "documents": self.documents,
+            self.unit: self.size,
+            "attempts": self.attempts,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "failed_ids": self.failed_ids,
+            "errors": self.errors[-3:],
+            "duration_ms": round(self.duration_ms, 1),
+        }
+
+
+def batch_order(result):
+    # Split batches are numbered "3.0", "3.1", ... after their parent "3"
+    return [int(part) for part in str(result.batch).split(".")]
+
+
+class BatchReport:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = []
+        self.elapsed_ms = 0.0
+
+    def add(self, result):
+        with self._lock:
+            self.batches.append(result)
+
+    @property
+    def succeeded(self):
+        return sum(b.succeeded for b in self.batches)
+
+    @property
+    def failed(self):
+        return sum(b.failed for b in self.batches)
+
+    def __len__(self):
+        return self.succeeded
+
+    def to_dict(self):
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_ms": round(self.elapsed_ms, 1),
+            "batches": [b.to_dict() for b in sorted(self.batches, key=batch_order)],
+        }
@@ -7,8 +7,14 @@ import urllib.parse
 from io import BytesIO
 from dotenv import load_dotenv
 from app.embedding import process_pdf
+from app.bulk_pipeline import run_bulk_pipeline, bulk_run_key
+from app.download_cache import download_cache
 load_dotenv()
 
+# "pipeline": parse/embed/upload stages overlap across brochures (see
+# app/bulk_pipeline.py); "sequential": one brochure at a time
+BULK_EMBED_MODE = os.getenv("BULK_EMBED_MODE", "pipeline")
+
 def get_excel_download_url(google_sheet_url: str) -> str:
     try:
         # Extract sheet ID from the URL
@@ -22,18 +28,20 @@ def get_excel_download_url(google_sheet_url: str) -> str:
         raise ValueError(f"Error parsing URL: {e}")
 
 
-def process_bulk_embedding(excel_url: str, index_name: str):
+def process_bulk_embedding(excel_url: str, index_name: str, force: bool = False, job=None):
+    # job: JobContext when run from the background queue (progress + cancel)
     try:
         PYTHON_APP_BASE_URL = os.getenv("PYTHON_APP_BASE_URL")
         download_url = get_excel_download_url(excel_url)
         print(download_url)
         
-        # Download Excel content from URL
-        response = requests.get(download_url)
-        if response.status_code != 200:
-            return {"status": "error", "message": f"Failed to download Excel file: {response.status_code}"}
+        # Download Excel content from URL (revalidated against the download cache)
+        try:
+            content = download_cache.read_bytes(download_url)
+        except requests.HTTPError as e:
+            return {"status": "error", "message": f"Failed to download Excel file: {e.response.status_code}"}
 
-        df = pd.read_excel(BytesIO(response.content))
+        df = pd.read_excel(BytesIO(content))
 
         # Process all pdf files (Extract, clean, sort, and slice the URLs)
         distinct_brochures = df['CollectionBrochure'].dropna().drop_duplicates().tolist()
@@ -44,15 +52,27 @@ def process_bulk_embedding(excel_url: str, index_name: str):
 
         print(f"Found {len(distinct_brochures)} unique brochure URLs")
 
+        if BULK_EMBED_MODE == "pipeline":
+            # Only a queued job can be picked up again after a crash, so only it resumes
+            run_key = bulk_run_key(excel_url, index_name, job.job_id) if job else None
+            return run_bulk_pipeline(distinct_brochures, index_name, force, run_key, job)
+
         results = []
+        if job:
+            job.start(distinct_brochures)
 
         for url in distinct_brochures:
+            if job and job.cancelled():
+                break
             try:
-                result = process_pdf(url, index_name)
+                result = process_pdf(url, index_name, force)
                 results.append({"url": url, "result": result})
             except Exception as e:
+                result = {"status": "error", "message": str(e)}
                 results.append({"url": url, "error": str(e)
                 })
+            if job:
+                job.update(url, result.get("status"), result)
 
         return {"processed": len(results), "results": results}
 
@@ -0,0 +1,245 @@
+# app/bulk_pipeline.py
+
+import os
+import time
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from app.embedding import IngestJob, parse_pdf, plan_job, embed_job, upload_job
+from app.ingest_manifest import ingest_manifest
+from app.pdf_extract import extract_sequentially
+from dotenv import load_dotenv
+load_dotenv()
+
+# Pipelined bulk brochure ingestion:
+#
+#   parse (process pool) -> [queue] -> plan + embed (async workers)
+#                        -> [queue] -> upload (async workers)
+#
+# Fetch + parse is CPU-bound and runs in worker processes; embedding and
+# upload are network-bound and run as a bounded number of async workers
+# (the blocking SDK calls go through asyncio.to_thread). Bounded queues
+# between the stages give backpressure: when uploads fall behind, embedding
+# stops pulling and parsing stops starting new PDFs.
+#
+# Up to BULK_EMBED_CONCURRENCY brochures are planned while others are still
+# embedding or uploading, and the chunk registry only learns a brochure's
+# chunks when it commits. Dedup therefore matches against brochures that
+# already finished: boilerplate shared by brochures in flight together is
+# embedded once per brochure (later runs dedup it). The registry keeps
+# concurrent commits and stale deletes consistent (see ChunkRegistry.commit
+# and release).
+#
+# Brochures that finished cleanly (embedded or unchanged) are recorded under
+# a run key (sheet + index + job id), so when a job's worker dies half way
+# and the queue hands the same job out again, it skips them. A new bulk
+# request is a new run and looks at every brochure again (the ingest
+# manifest still makes unchanged ones cheap); failed, partial and cancelled
+# brochures are never recorded, so they are always retried. The progress is
+# cleared when the run completes.
+
+BULK_PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+BULK_EMBED_CONCURRENCY = int(os.getenv("BULK_EMBED_CONCURRENCY", "4"))
+BULK_UPLOAD_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", "4"))
+BULK_QUEUE_SIZE = int(os.getenv("BULK_QUEUE_SIZE", "8"))
+# Parse workers run at lower CPU priority so chat requests keep their cores
+BULK_PARSE_NICE = int(os.getenv("BULK_PARSE_NICE", "10"))
+
+
+def init_parse_worker():
+    extract_sequentially()
+    try:
+        os.nice(BULK_PARSE_NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+def bulk_run_key(source, index_name, run_id):
+    return hashlib.sha256(f"{index_name}\0{source}\0{run_id}".encode("utf-8")).hexdigest()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.chunks = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.first_start = None
+        self.last_end = None
+
+    def start(self):
+        now = time.perf_counter()
+        if self.first_start is None:
+            self.first_start = now
+        return now
+
+    def finish(self, started, chunks=0, error=False):
+        self.last_end = time.perf_counter()
+        self.busy_s += self.last_end - started
+        self.items += 1
+        self.chunks += chunks
+        self.errors += int(error)
+
+    def to_dict(self):
+        wall = (self.last_end - self.first_start) if self.items else 0.0
+        return {
+            "items": self.items,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "wall_s": round(wall, 2),
+            "avg_item_ms": round(self.busy_s * 1000 / self.items, 1) if self.items else 0.0,
+            "items_per_s": round(self.items / wall, 3) if wall else 0.0,
+            "chunks_per_s": round(self.chunks / wall, 2) if wall else 0.0,
+        }
+
+
+class BulkPipeline:
+    def __init__(self, index_name, force=False, run_key=None, job=None, parse_workers=BULK_PARSE_WORKERS,
+                 embed_concurrency=BULK_EMBED_CONCURRENCY, upload_concurrency=BULK_UPLOAD_CONCURRENCY,
+                 queue_size=BULK_QUEUE_SIZE):
+        self.index_name = index_name
+        self.force = force
+        self.run_key = run_key
+        self.job = job  # JobContext when running as a background job
+        self.parse_workers = parse_workers
+        self.embed_concurrency = embed_concurrency
+        self.upload_concurrency = upload_concurrency
+        self.queue_size = queue_size
+        self.stages = {name: StageStats(name) for name in ("parse", "embed", "upload")}
+        self.results = {}
+
+    def _progress(self, url, status, result=None):
+        if self.job:
+            self.job.update(url, status, result)
+
+    def _cancelled(self):
+        return bool(self.job and self.job.cancelled())
+
+    def _finish(self, url, result):
+        self.results[url] = result
+        self._progress(url, result.get("status"), result)
+        if self.run_key and result.get("status") in ("embedded", "unchanged"):
+            ingest_manifest.mark_bulk(self.run_key, url, "done")
+
+    async def _parse_stage(self, urls, parsed):
+        # Spawned workers: forking a process that runs an event loop and
+        # thread pools is not safe
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.parse_workers)
+        stats = self.stages["parse"]
+
+        async def parse_one(pool, url):
+            try:
+                self._progress(url, "parsing")
+                started = stats.start()
+                try:
+                    pdf_name, texts, metadata = await loop.run_in_executor(pool, parse_pdf, url)
+                except Exception as e:
+                    stats.finish(started, error=True)
+                    self._finish(url, {"status": "error", "message": str(e)})
+                    return
+                stats.finish(started, chunks=len(texts))
+                # Blocks while the embed stage is backed up
+                await parsed.put(IngestJob(url, self.index_name, pdf_name, texts, metadata, self.force))
+            finally:
+                slots.release()
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=context, initializer=init_parse_worker) as pool:
+            tasks = []
+            for url in urls:
+                await slots.acquire()
+                if self._cancelled():
+                    slots.release()
+                    self._finish(url, {"status": "cancelled"})
+                    continue
+                tasks.append(asyncio.create_task(parse_one(pool, url)))
+            await asyncio.gather(*tasks)
+
+    async def _embed_worker(self, parsed, embedded):
+        stats = self.stages["embed"]
+        while True:
+            job = await parsed.get()
+            if job is None:
+                return
+            if self._cancelled():
+                self._finish(job.pdf_path, {"status": "cancelled"})
+                continue
+            self._progress(job.pdf_path, "embedding")
+            started = stats.start()
+            try:
+                result = await asyncio.to_thread(plan_job, job)
+                if result is None:
+                    result = await asyncio.to_thread(embed_job, job)
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            stats.finish(started, chunks=len(job.vectors), error=bool(result and result["status"] == "error"))
+            if result is not None:
+                self._finish(job.pdf_path, result)
+            else:
+                await embedded.put(job)
+
+    async def _upload_worker(self, embedded):
+        stats = self.stages["upload"]
+        while True:
+            job = await embedded.get()
+            if job is None:
+                return
+            self._progress(job.pdf_path, "uploading")
+            started = stats.start()
+            try:
+                result = await asyncio.to_thread(upload_job, job)
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            stats.finish(started, chunks=len(job.vectors), error=result["status"] == "error")
+            self._finish(job.pdf_path, result)
+
+    async def run(self, urls):
+        started = time.perf_counter()
+        done = ingest_manifest.bulk_done(self.run_key) if self.run_key and not self.force else set()
+        todo = [url for url in urls if url not in done]
+        if self.job:
+            self.job.start(urls)
+            for url in urls:
+                if url in done:
+                    self._progress(url, "unchanged", {"status": "unchanged", "resumed": True})
+        if done:
+            print(f"[Bulk] resuming: {len(urls) - len(todo)} of {len(urls)} brochures already done")
+
+        parsed = asyncio.Queue(maxsize=self.queue_size)
+        embedded = asyncio.Queue(maxsize=self.queue_size)
+        embedders = [asyncio.create_task(self._embed_worker(parsed, embedded)) for _ in range(self.embed_concurrency)]
+        uploaders = [asyncio.create_task(self._upload_worker(embedded)) for _ in range(self.upload_concurrency)]
+        try:
+            await self._parse_stage(todo, parsed)
+            for _ in embedders:
+                await parsed.put(None)
+            await asyncio.gather(*embedders)
+            for _ in uploaders:
+                await embedded.put(None)
+            await asyncio.gather(*uploaders)
+        finally:
+            for task in embedders + uploaders:
+                task.cancel()
+
+        failed = [url for url in todo if self.results.get(url, {}).get("status") not in ("embedded", "unchanged")]
+        if self.run_key:
+            ingest_manifest.clear_bulk(self.run_key)
+        elapsed = time.perf_counter() - started
+        stages = {name: stats.to_dict() for name, stats in self.stages.items()}
+        print(f"[Bulk] {len(todo)} brochures in {elapsed:.1f}s, {len(failed)} failed | {stages}")
+        return {
+            "processed": len(todo),
+            "resumed": len(urls) - len(todo),
+            "failed": len(failed),
+            "elapsed_s": round(elapsed, 2),
+            "stages": stages,
+            "results": [{"url": url, "result": self.results.get(url)} for url in todo],
+        }
+
+
+def run_bulk_pipeline(urls, index_name, force=False, run_key=None, job=None):
+    # Sync entry point for callers without a running event loop
+    return asyncio.run(BulkPipeline(index_name, force=force, run_key=run_key, job=job).run(urls))
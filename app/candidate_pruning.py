@@ -0,0 +1,104 @@
+# app/candidate_pruning.py
+
+import os
+import threading
+from collections import Counter
+from app.catalog_store import get_catalog
+from app.filter_extractor import tokenize, normalize_term, STOPWORDS
+from dotenv import load_dotenv
+load_dotenv()
+
+# Narrows the known collection/style names sent to the filter-extraction
+# prompt down to the few that look like something in the query. Candidates
+# are ranked by character-trigram Dice similarity against every 1..4 word
+# window of the query, looked up through an inverted trigram index.
+
+FILTER_PROMPT_TOP_N = int(os.getenv("FILTER_PROMPT_TOP_N", "15"))
+FILTER_PROMPT_MIN_SCORE = float(os.getenv("FILTER_PROMPT_MIN_SCORE", "0.35"))
+MAX_WINDOW_WORDS = 4
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CandidateIndex:
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.sizes = []
+        self.postings = {}  # trigram -> [candidate position]
+        for pos, name in enumerate(self.names):
+            grams = trigrams(normalize_term(name))
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(pos)
+
+    def top_matches(self, query, top_n=FILTER_PROMPT_TOP_N, min_score=FILTER_PROMPT_MIN_SCORE):
+        tokens = [t for t in tokenize(query) if t not in STOPWORDS]
+        best = {}
+        for size in range(1, MAX_WINDOW_WORDS + 1):
+            for start in range(len(tokens) - size + 1):
+                grams = trigrams(" ".join(tokens[start:start + size]))
+                overlap = Counter()
+                for gram in grams:
+                    overlap.update(self.postings.get(gram, ()))
+                for pos, shared in overlap.items():
+                    score = 2 * shared / (len(grams) + self.sizes[pos])
+                    if score > best.get(pos, 0.0):
+                        best[pos] = score
+
+        ranked = sorted(
+            (pos for pos, score in best.items() if score >= min_score),
+            key=lambda pos: (-best[pos], self.names[pos]),
+        )
+        return [self.names[pos] for pos in ranked[:top_n]]
+
+
+_indexes = {}  # (index_name, field) -> (catalog version, CandidateIndex)
+_indexes_lock = threading.Lock()
+
+
+def _get_index(index_name, field, names):
+    version = get_catalog(index_name).version
+    key = (index_name, field)
+    cached = _indexes.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        index = CandidateIndex(names)
+        _indexes[key] = (version, index)
+        return index
+
+
+def prune_candidates(user_query, index_name, field, names, top_n=FILTER_PROMPT_TOP_N):
+    return _get_index(index_name, field, names).top_matches(user_query, top_n=top_n)
+
+
+class PromptTokenReport:
+    # Running totals of filter-prompt tokens with and without pruning
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.full_tokens = 0
+        self.pruned_tokens = 0
+
+    def record(self, full_tokens, pruned_tokens):
+        with self._lock:
+            self.calls += 1
+            self.full_tokens += full_tokens
+            self.pruned_tokens += pruned_tokens
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "avg_full_tokens": round(self.full_tokens / self.calls, 1) if self.calls else 0,
+            "avg_pruned_tokens": round(self.pruned_tokens / self.calls, 1) if self.calls else 0,
+            "reduction": round(1 - self.pruned_tokens / self.full_tokens, 4) if self.full_tokens else 0.0,
+        }
+
+
+prompt_token_report = PromptTokenReport()
@@ -0,0 +1,228 @@
+# app/catalog_snapshot.py
+
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+
+# Compact, memory-mappable snapshot of a Crest product list.
+#
+# Layout (little-endian):
+#   header   MAGIC | u32 format version | u32 rows | u32 schema length
+#   schema   JSON: [{"name", "json", "codes", "offsets", "blob", "size", "blob_len"}, ...]
+#   columns  per column, 8-byte aligned:
+#              codes    u32[rows]       index into the column's string table
+#              offsets  u32[size + 1]   byte offsets into blob
+#              blob     utf-8 bytes of the distinct values
+#
+# Every column is dictionary-encoded, so repeated values (collection, style,
+# product type, ...) are stored once. Readers mmap the file read-only, which
+# lets every uvicorn worker share one page-cache copy of the catalog.
+
+MAGIC = b"CRSTSNP1"
+FORMAT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snap"
+
+MISSING = 0xFFFFFFFF  # key absent from the source record
+NULL = 0xFFFFFFFE     # key present with a null value
+
+_HEADER = struct.Struct("<8sIII")
+
+
+def snapshot_path_for(json_path):
+    root, _ = os.path.splitext(json_path)
+    return root + SNAPSHOT_SUFFIX
+
+
+def _pad(buf):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def _u32_bytes(values):
+    arr = array("I", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def write_snapshot(records, path):
+    columns = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+
+    schema, sections = [], []
+    for name in columns:
+        values = [record.get(name, None) if name in record else MISSING for record in records]
+        # Columns holding anything other than strings are stored JSON-encoded
+        is_json = any(v is not MISSING and v is not None and not isinstance(v, str) for v in values)
+
+        table, codes = {}, []
+        for v in values:
+            if v is MISSING:
+                codes.append(MISSING)
+            elif v is None:
+                codes.append(NULL)
+            else:
+                key = json.dumps(v, ensure_ascii=False) if is_json else v
+                codes.append(table.setdefault(key, len(table)))
+
+        blob, offsets = bytearray(), [0]
+        for text in table:
+            blob.extend(text.encode("utf-8"))
+            offsets.append(len(blob))
+
+        schema.append({"name": name, "json": is_json, "size": len(table), "blob_len": len(blob)})
+        sections.append((_u32_bytes(codes), _u32_bytes(offsets), bytes(blob)))
+
+    # Resolve section positions once the schema length is known. The schema
+    # contains its own offsets, so iterate until the encoding is a fixed
+    # point: the offsets written are the ones computed for its own length.
+    schema_bytes = None
+    while True:
+        pos = _HEADER.size + len(schema_bytes or b"")
+        pos += -pos % 8
+        for entry, (codes, offsets, blob) in zip(schema, sections):
+            entry["codes"] = pos
+            pos += len(codes)
+            pos += -pos % 8
+            entry["offsets"] = pos
+            pos += len(offsets)
+            pos += -pos % 8
+            entry["blob"] = pos
+            pos += len(blob)
+            pos += -pos % 8
+        encoded = json.dumps(schema, separators=(",", ":")).encode("utf-8")
+        if encoded == schema_bytes:
+            break
+        schema_bytes = encoded
+
+    out = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, len(records), len(schema_bytes)))
+    out.extend(schema_bytes)
+    _pad(out)
+    for codes, offsets, blob in sections:
+        for part in (codes, offsets, blob):
+            out.extend(part)
+            _pad(out)
+
+    # Write to a temp file and swap it in, so live readers keep their mapping.
+    # The temp file is read back first: a snapshot that does not reproduce
+    # its records never replaces a good one.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    try:
+        verify_snapshot(records, tmp_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def verify_snapshot(records, path):
+    # Write -> read round trip; raises ValueError on the first mismatch
+    with CatalogSnapshot(path) as snapshot:
+        if len(snapshot) != len(records):
+            raise ValueError(f"Snapshot '{path}' has {len(snapshot)} rows, expected {len(records)}.")
+        for i, record in enumerate(records):
+            if snapshot.row(i) != record:
+                raise ValueError(f"Snapshot '{path}' does not reproduce row {i}.")
+
+
+class _Column:
+    def __init__(self, snapshot, entry):
+        rows = len(snapshot)
+        view = snapshot._view
+        self.name = entry["name"]
+        self.is_json = entry["json"]
+        self.size = entry["size"]
+        self.codes = view[entry["codes"]:entry["codes"] + 4 * rows].cast("I")
+        self.offsets = view[entry["offsets"]:entry["offsets"] + 4 * (self.size + 1)].cast("I")
+        self.blob = view[entry["blob"]:entry["blob"] + entry["blob_len"]]
+        self._decoded = {}
+
+    def value(self, code):
+        if code == MISSING or code == NULL:
+            return None
+        cached = self._decoded.get(code)
+        if cached is None:
+            text = bytes(self.blob[self.offsets[code]:self.offsets[code + 1]]).decode("utf-8")
+            cached = json.loads(text) if self.is_json else text
+            self._decoded[code] = cached
+        return cached
+
+    def distinct(self):
+        return [self.value(code) for code in range(self.size)]
+
+
+class CatalogSnapshot:
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("Catalog snapshots can only be mapped on little-endian hosts.")
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, rows, schema_len = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"'{path}' is not a catalog snapshot (format {FORMAT_VERSION}).")
+
+        self._rows = rows
+        schema = json.loads(bytes(self._view[_HEADER.size:_HEADER.size + schema_len]))
+        self._columns = {entry["name"]: _Column(self, entry) for entry in schema}
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def get(self, row, name):
+        column = self._columns.get(name)
+        if column is None:
+            return None
+        return column.value(column.codes[row])
+
+    def row(self, row):
+        record = {}
+        for name, column in self._columns.items():
+            code = column.codes[row]
+            if code != MISSING:
+                record[name] = column.value(code)
+        return record
+
+    def records(self):
+        return [self.row(i) for i in range(self._rows)]
+
+    def column(self, name):
+        column = self._columns[name]
+        return [column.value(code) for code in column.codes]
+
+    def distinct(self, name):
+        column = self._columns.get(name)
+        return column.distinct() if column else []
+
+    def close(self):
+        for column in getattr(self, "_columns", {}).values():
+            column.codes.release()
+            column.offsets.release()
+            column.blob.release()
+        self._columns = {}
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,205 @@
+# app/catalog_store.py
+
+import os
+import json
+import hashlib
+import threading
+from app.constants import INDEX_TO_JSON_FILE
+from app.catalog_snapshot import CatalogSnapshot, snapshot_path_for
+
+# In-memory, indexed copy of the cached Crest product catalog.
+# Each index's cache file is loaded once per process and only reloaded
+# when the file's mtime (or size) changes on disk. A binary snapshot next
+# to the JSON (see app/catalog_snapshot.py) is preferred when it is at least
+# as fresh: it is memory-mapped instead of parsed.
+
+
+def vocabulary_hash(collections, styles):
+    # Content hash of the names that feed filter extraction; unchanged by a
+    # Crest refresh that only touches other fields
+    digest = hashlib.sha1()
+    for name in sorted(collections):
+        digest.update(b"c\0" + name.encode("utf-8") + b"\0")
+    for name in sorted(styles):
+        digest.update(b"s\0" + name.encode("utf-8") + b"\0")
+    return digest.hexdigest()[:16]
+
+
+class Catalog:
+    def __init__(self, items, version):
+        self.items = items
+        self.version = version
+        self.by_sku = {}
+        self.by_collection = {}
+        self.by_style = {}
+        self._distinct = {}
+
+        for item in items:
+            sku = (item.get("sku") or "").strip()
+            if sku and sku not in self.by_sku:
+                self.by_sku[sku] = item
+
+            collection = (item.get("collectionName") or "").strip()
+            if collection:
+                self.by_collection.setdefault(collection, []).append(item)
+
+            style = (item.get("styleName") or "").strip()
+            if style:
+                self.by_style.setdefault(style, []).append(item)
+
+        self.collections = frozenset(self.by_collection)
+        self.styles = frozenset(self.by_style)
+        self.vocabulary_hash = vocabulary_hash(self.collections, self.styles)
+
+    def get_by_sku(self, sku):
+        return self.by_sku.get((sku or "").strip())
+
+    def get_by_collection(self, collection):
+        return self.by_collection.get((collection or "").strip(), [])
+
+    def get_by_style(self, style):
+        return self.by_style.get((style or "").strip(), [])
+
+    def distinct(self, field):
+        values = self._distinct.get(field)
+        if values is None:
+            values = frozenset(
+                v.strip() for v in (item.get(field) for item in self.items)
+                if isinstance(v, str) and v.strip()
+            )
+            self._distinct[field] = values
+        return values
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SnapshotCatalog:
+    # Same interface as Catalog, backed by a memory-mapped snapshot. Indexes
+    # hold row numbers; product dicts are only materialized when asked for.
+
+    def __init__(self, snapshot, version):
+        self.snapshot = snapshot
+        self.version = version
+        self._items = None
+        self.by_sku = {}
+        self.by_collection = {}
+        self.by_style = {}
+
+        for key, name, multi in (
+            (self.by_sku, "sku", False),
+            (self.by_collection, "collectionName", True),
+            (self.by_style, "styleName", True),
+        ):
+            for row, value in enumerate(snapshot.column(name) if name in snapshot.columns else []):
+                value = (value or "").strip()
+                if not value:
+                    continue
+                if multi:
+                    key.setdefault(value, []).append(row)
+                elif value not in key:
+                    key[value] = row
+
+        self.collections = frozenset(self.by_collection)
+        self.styles = frozenset(self.by_style)
+        self.vocabulary_hash = vocabulary_hash(self.collections, self.styles)
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = self.snapshot.records()
+        return self._items
+
+    def get_by_sku(self, sku):
+        row = self.by_sku.get((sku or "").strip())
+        return self.snapshot.row(row) if row is not None else None
+
+    def get_by_collection(self, collection):
+        return [self.snapshot.row(r) for r in self.by_collection.get((collection or "").strip(), [])]
+
+    def get_by_style(self, style):
+        return [self.snapshot.row(r) for r in self.by_style.get((style or "").strip(), [])]
+
+    def distinct(self, field):
+        # Distinct values are the column's string table; no row scan needed
+        return frozenset(
+            v.strip() for v in self.snapshot.distinct(field)
+            if isinstance(v, str) and v.strip()
+        )
+
+    def close(self):
+        self._items = None
+        self.snapshot.close()
+
+    def __len__(self):
+        return len(self.snapshot)
+
+
+class CatalogStore:
+    def __init__(self, index_to_file=None):
+        self._index_to_file = index_to_file or INDEX_TO_JSON_FILE
+        self._catalogs = {}  # index_name -> (file signature, Catalog)
+        self._lock = threading.Lock()
+
+    def _resolve_path(self, index_name):
+        file_path = self._index_to_file.get(index_name)
+        if not file_path:
+            raise FileNotFoundError(f"Cache file for index '{index_name}' not found.")
+
+        snapshot_path = snapshot_path_for(file_path)
+        if os.path.exists(snapshot_path):
+            if not os.path.exists(file_path) or os.path.getmtime(snapshot_path) >= os.path.getmtime(file_path):
+                return snapshot_path
+
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Cache file for index '{index_name}' not found.")
+        return file_path
+
+    @staticmethod
+    def _signature(file_path):
+        stat = os.stat(file_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, index_name):
+        file_path = self._resolve_path(index_name)
+        signature = self._signature(file_path)
+
+        cached = self._catalogs.get(index_name)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            cached = self._catalogs.get(index_name)
+            if cached and cached[0] == signature:
+                return cached[1]
+
+            version = f"{signature[0]}-{signature[1]}"
+            if file_path.endswith(".json"):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    catalog = Catalog(json.load(f), version)
+            else:
+                catalog = SnapshotCatalog(CatalogSnapshot(file_path), version)
+
+            # The old snapshot mapping is left for the garbage collector: other
+            # threads may still hold a reference to the previous catalog.
+            self._catalogs[index_name] = (signature, catalog)
+            print(f"[Catalog] Loaded {len(catalog)} products for '{index_name}' (version {version})")
+            return catalog
+
+    def invalidate(self, index_name=None):
+        with self._lock:
+            if index_name is None:
+                self._catalogs.clear()
+            else:
+                self._catalogs.pop(index_name, None)
+
+
+catalog_store = CatalogStore()
+
+
+def get_catalog(index_name):
+    return catalog_store.get(index_name)
@@ -3,18 +3,33 @@
 import os
 import json
 import re
-from openai import AzureOpenAI
-from app.azure_search import search_similar_content
+import time
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from app.vector_store import search_similar_content, asearch_similar_content
 from azure.search.documents.models import VectorizedQuery
-from app.db.database import get_db  # session management
-from app.db.product_metadata import search_product_metadata
+from app.db.database import get_db, get_async_db  # session management
+from app.db.product_metadata import search_product_metadata, asearch_product_metadata
+from app.db.data_version import product_version, aproduct_version
 from app.models import IndexName
-from app.constants import INDEX_TO_DB_CLASSIFICATION, INDEX_TO_JSON_FILE
+from app.constants import INDEX_TO_DB_CLASSIFICATION
+from app.catalog_store import get_catalog
+from app.pipeline import StageGraph
+from app.embedding_cache import embedding_cache
+from app.embedding_profile import get_embedding_profile
+from app.answer_cache import answer_cache
+from app.filter_cache import get_cached_filters, set_cached_filters
+from app.filter_extractor import extract_local_filters, LOCAL_FILTER_MIN_CONFIDENCE
+from app.hybrid_search import tokenize
+from app.candidate_pruning import prune_candidates, prompt_token_report
+from app.tokens import count_tokens
+from app.context_builder import build_context
 from app.constants import ALLOWED_FILTER_FIELDS
 from dotenv import load_dotenv
 load_dotenv()
 
 EMBEDDING_DIM = 3072
+# Brochure chunks retrieved per question
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", "10"))
 
 client = AzureOpenAI(
     api_version=os.getenv("AZURE_OPENAI_EMBEDDING_API_VERSION"),
@@ -22,59 +37,103 @@ client = AzureOpenAI(
     api_key=os.getenv("AZURE_OPENAI_API_KEY")
 )
 
+# Async twin of `client`, used by the /chat/ and /ws/chat/ handlers so that
+# OpenAI round trips don't block the event loop.
+async_client = AsyncAzureOpenAI(
+    api_version=os.getenv("AZURE_OPENAI_EMBEDDING_API_VERSION"),
+    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    api_key=os.getenv("AZURE_OPENAI_API_KEY")
+)
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful flooring advisor. "
+    "Answer user questions using the provided context. "
+    "Include key product details: name, SKU, collection, color, backing, construction, and product URL if available. "
+    "Also show product thumbnails using Markdown `![image](url)` syntax. "
+    "When responding, format your answer using Markdown. "
+    "Use **bold**, *italics*, bullet points, numbered lists, and section headings (###) where appropriate. "
+    "Your output will be displayed in a web UI that supports Markdown rendering via marked.js."
+)
+
 # Example function to generate document embedding
 def generate_embeddings(text, model):
+    cached = embedding_cache.get(text, model)
+    if cached is not None:
+        return cached
     # Generate embeddings for the provided text using the specified model
     embeddings_response = client.embeddings.create(model=model, input=text)
     # Extract the embedding data from the response
     embedding = embeddings_response.data[0].embedding
+    embedding_cache.set(text, model, embedding)
+    return embedding
+
+async def agenerate_embeddings(text, model):
+    cached = await embedding_cache.aget(text, model)
+    if cached is not None:
+        return cached
+    embeddings_response = await async_client.embeddings.create(model=model, input=text)
+    embedding = embeddings_response.data[0].embedding
+    embedding_cache.set(text, model, embedding)
     return embedding
 
+def query_vector(embedding):
+    # Shape the query like the stored brochure vectors (same dims, unit length);
+    # the embedding cache keeps the full-size vector
+    return get_embedding_profile().truncate(embedding).tolist()
+
 def load_cached_products(index_name):
-    file_path = INDEX_TO_JSON_FILE.get(index_name)
-    if not file_path or not os.path.exists(file_path):
-        raise FileNotFoundError(f"Cache file for index '{index_name}' not found.")
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_catalog(index_name).items
 
 def get_known_collections(index_name):
-    data = load_cached_products(index_name)
-    return {item.get("collectionName", "").strip() for item in data if item.get("collectionName")}
+    return get_catalog(index_name).collections
 
 def get_known_styles(index_name):
-    data = load_cached_products(index_name)
-    return {item.get("styleName", "").strip() for item in data if item.get("styleName")}
+    return get_catalog(index_name).styles
 
-def extract_structured_filters(user_query, index_name):
+def build_filter_system_prompt(known_collections, known_styles):
     # system_prompt = (
     #     "Extract key flooring product filters from the user query. "
     #     "Return them as a JSON object with possible keys: collection_name, style_name, color_code, marketing_color_name, construction, backing_description. "
     #     "Do not wrap the JSON inside markdown code block."
     # )
-
-    known_collections = get_known_collections(index_name) 
-    known_styles = get_known_styles(index_name)
-
-    system_prompt = (
+    return (
         "Extract key flooring product filters from the user query. "
         f"Allowed fields: {', '.join(ALLOWED_FILTER_FIELDS)}. "
         "Match terms to the most appropriate field. "
-        f"If the value is in this list of collections: {known_collections}, assign it to `collection_name`. "
-        f"If in this list of style names: {known_styles}, assign it to `style_name`. "
+        f"If the value is in this list of collections: {sorted(known_collections)}, assign it to `collection_name`. "
+        f"If in this list of style names: {sorted(known_styles)}, assign it to `style_name`. "
         "Return a valid JSON object, no markdown, no extra explanation."
     )
 
-    response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_GPT_DEPLOYMENT_NAME"),
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Query: {user_query}"}
-        ],
-        temperature=0.2,
-        max_tokens=100
-    )
+_full_filter_prompt_tokens = {}  # (index_name, catalog version) -> tokens
 
-    raw_keywords = response.choices[0].message.content.strip()
+def get_full_filter_prompt_tokens(index_name):
+    catalog = get_catalog(index_name)
+    key = (index_name, catalog.version)
+    if key not in _full_filter_prompt_tokens:
+        _full_filter_prompt_tokens[key] = count_tokens(build_filter_system_prompt(catalog.collections, catalog.styles))
+    return _full_filter_prompt_tokens[key]
+
+def build_filter_messages(user_query, index_name):
+    # Only the collection/style names that resemble something in the query
+    # go into the prompt, instead of the whole catalog vocabulary
+    catalog = get_catalog(index_name)
+    known_collections = prune_candidates(user_query, index_name, "collection_name", catalog.collections)
+    known_styles = prune_candidates(user_query, index_name, "style_name", catalog.styles)
+
+    system_prompt = build_filter_system_prompt(known_collections, known_styles)
+
+    full_tokens = get_full_filter_prompt_tokens(index_name)
+    pruned_tokens = count_tokens(system_prompt)
+    prompt_token_report.record(full_tokens, pruned_tokens)
+    print(f"[Filter prompt] {full_tokens} -> {pruned_tokens} tokens ({len(known_collections)} collections, {len(known_styles)} styles)")
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Query: {user_query}"}
+    ]
+
+def parse_filters(raw_keywords, index_name):
     print(f'raw_keywords ==> {raw_keywords}')
 
     try:
@@ -86,7 +145,7 @@ def extract_structured_filters(user_query, index_name):
 
         if "style_name" in filters:
             style = filters["style_name"]
-            if style in known_collections:
+            if style in get_known_collections(index_name):
                 filters["collection_name"] = style
                 del filters["style_name"]
 
@@ -95,15 +154,85 @@ def extract_structured_filters(user_query, index_name):
         print(f"[!] Failed to parse filter JSON: {e}")
         return {}
 
-def enrich_with_api_data(product_rows, api_data):
+def extract_confident_local_filters(user_query, index_name):
+    filters, confidence = extract_local_filters(user_query, index_name)
+    print(f"Local filters: {filters} (confidence {confidence})")
+    if confidence >= LOCAL_FILTER_MIN_CONFIDENCE:
+        return filters
+    return None
+
+def extract_structured_filters(user_query, index_name):
+    local_filters = extract_confident_local_filters(user_query, index_name)
+    if local_filters is not None:
+        return local_filters
+
+    cached = get_cached_filters(user_query, index_name)
+    if cached is not None:
+        return cached
+
+    response = client.chat.completions.create(
+        model=os.getenv("AZURE_OPENAI_GPT_DEPLOYMENT_NAME"),
+        messages=build_filter_messages(user_query, index_name),
+        temperature=0.2,
+        max_tokens=100
+    )
+    filters = parse_filters(response.choices[0].message.content.strip(), index_name)
+    # Empty results may be a parse failure, so they are retried next time
+    if filters:
+        set_cached_filters(user_query, index_name, filters)
+    return filters
+
+async def aextract_structured_filters(user_query, index_name):
+    local_filters = extract_confident_local_filters(user_query, index_name)
+    if local_filters is not None:
+        return local_filters
+
+    cached = get_cached_filters(user_query, index_name)
+    if cached is not None:
+        return cached
+
+    response = await async_client.chat.completions.create(
+        model=os.getenv("AZURE_OPENAI_GPT_DEPLOYMENT_NAME"),
+        messages=build_filter_messages(user_query, index_name),
+        temperature=0.2,
+        max_tokens=100
+    )
+    filters = parse_filters(response.choices[0].message.content.strip(), index_name)
+    if filters:
+        set_cached_filters(user_query, index_name, filters)
+    return filters
+
+def add_classification_filter(filters, index_name):
+    # Inject classification for DB filtering
+    if index_name == IndexName.all_products.value:
+        filters["product_classification"] = list(INDEX_TO_DB_CLASSIFICATION.values())
+    else:
+        db_classification = INDEX_TO_DB_CLASSIFICATION.get(index_name)
+        if db_classification:
+            filters["product_classification"] = [db_classification]
+    return filters
+
+def infer_fallback_filters(brochure_context, filters):
+    print(f'there is no product_rows')
+    match = re.search(r"Collection:?\s*(.+?)(?:\n|$)", brochure_context, re.IGNORECASE)
+    print(f"fallback match 1 : {match}")
+    if not match:
+        return None
+    print(f"fallback match 2 : {match}")
+    inferred_collection = match.group(1).strip()
+    print(f"🔁 Inferred collection from brochure: {inferred_collection}")
+    fallback_filters = {
+        "collection_name": inferred_collection,
+        "product_classification": filters.get("product_classification", [])
+    }
+    print(f"fallback_filters: {fallback_filters}")
+    return fallback_filters
+
+def enrich_with_api_data(product_rows, catalog):
     enriched_rows = []
 
     for row in product_rows:
-        match = next(
-            (item for item in api_data if
-             item["sku"].strip() == (row.sku or "").strip()),
-            None
-        )
+        match = catalog.get_by_sku(row.sku)
 
         enriched_rows.append({
             "style_name": row.style_name,
@@ -118,59 +247,16 @@ def enrich_with_api_data(product_rows, api_data):
 
     return enriched_rows
 
-def chat_with_gpt(user_input, index_name):
-    # Step 1: Embed query
-    vector_query = VectorizedQuery(vector=generate_embeddings(user_input, os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")), k_nearest_neighbors=10, fields="embedding")
-    print(f'User input ==> {user_input} & index_name ==> {index_name}')
-    # print(f'query_vector ==> {vector_query}')
+def build_chat_messages(user_input, index_name, brochure_chunks, product_rows):
+    catalog = get_catalog(index_name)
 
-    # Step 2: Get unstructured brochure chunks
-    top_chunks = search_similar_content(vector_query, index_name, top_k=10)
-    print(f'Top chunks from Azure Search ==> {len(top_chunks)}')
-    brochure_context = "\n\n".join(top_chunks)
-
-    # Step 3: Get structured product rows
-    db = next(get_db())
-    filters = extract_structured_filters(user_input, index_name)
-
-    # Inject classification for DB filtering
-    if index_name == IndexName.all_products.value:
-        filters["product_classification"] = list(INDEX_TO_DB_CLASSIFICATION.values())
-    else:
-        db_classification = INDEX_TO_DB_CLASSIFICATION.get(index_name)
-        if db_classification:
-            filters["product_classification"] = [db_classification]
-        
-    print(f"Structured Filters: {filters}")
-    product_rows = search_product_metadata(db, filters, 10)
-    print(f"product_rows: {product_rows}")
-
-    if not product_rows:
-        print(f'there is no product_rows')
-        match = re.search(r"Collection:?\s*(.+?)(?:\n|$)", brochure_context, re.IGNORECASE)
-        print(f"fallback match 1 : {match}")
-        if match:
-            print(f"fallback match 2 : {match}")
-            inferred_collection = match.group(1).strip()
-            print(f"🔁 Inferred collection from brochure: {inferred_collection}")
-            fallback_filters = {
-                "collection_name": inferred_collection,
-                "product_classification": filters.get("product_classification", [])
-            }
-            print(f"fallback_filters: {fallback_filters}")
-            product_rows = search_product_metadata(db, fallback_filters, 10)
-            print(f"fallback product_rows: {product_rows}")
-
-    api_data = load_cached_products(index_name)
-
-    enriched = enrich_with_api_data(product_rows, api_data)
+    enriched = enrich_with_api_data(product_rows, catalog)
 
     print(f"enriched product_rows: {enriched}")
 
-    # Build product section
-    product_context = ""
-    for p in enriched:
-        product_context += (
+    # One block per product, in ranking order
+    product_blocks = [
+        (
             f"**Product**: {p['style_name']}  \n"
             f"**SKU**: {p['sku']}  \n"
             f"**Collection**: {p['collection_name']}  \n"
@@ -180,44 +266,221 @@ def chat_with_gpt(user_input, index_name):
             f"{'**URL**: ' + p['producturl'] if p['producturl'] else ''}  \n"
             f"{'![thumb](' + p['thumb_image'] + ')' if p['thumb_image'] else ''}  \n\n"
         )
+        for p in enriched
+    ]
+
+    # Combine into one prompt context, each section under its own token budget
+    context = build_context(brochure_chunks, product_blocks)
+    print(f"[Context] {context.summary()}")
+    full_context = context.render()
+
+    return [
+        {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Use this context: {full_context}\n\nQuestion: {user_input}"}
+    ]
+
+def build_retrieval_graph(user_input, index_name, embedding):
+    # search -------------------------------+
+    # filters -> products -> fallback_products (brochure fallback needs search)
+    # The query embedding is computed up front so the answer cache can be
+    # checked before any of these stages start.
+    db = next(get_db())
 
+    def search():
+        vector_query = VectorizedQuery(vector=embedding, k_nearest_neighbors=SEARCH_TOP_K, fields="embedding")
+        top_chunks = search_similar_content(vector_query, index_name, top_k=SEARCH_TOP_K, query_text=user_input)
+        print(f'Top chunks from Azure Search ==> {len(top_chunks)}')
+        return top_chunks
+
+    def filters():
+        structured = add_classification_filter(extract_structured_filters(user_input, index_name), index_name)
+        print(f"Structured Filters: {structured}")
+        return structured
+
+    def products(filters):
+        product_rows = search_product_metadata(db, filters, 10)
+        print(f"product_rows: {product_rows}")
+        return product_rows
+
+    def fallback_products(products, search, filters):
+        if products:
+            return products
+        fallback_filters = infer_fallback_filters("\n\n".join(search), filters)
+        if not fallback_filters:
+            return products
+        product_rows = search_product_metadata(db, fallback_filters, 10)
+        print(f"fallback product_rows: {product_rows}")
+        return product_rows
+
+    return (
+        StageGraph()
+        .add("search", search)
+        .add("filters", filters)
+        .add("products", products, deps=["filters"])
+        .add("fallback_products", fallback_products, deps=["products", "search", "filters"])
+    )
 
-    # product_context = ""
-    # for product in product_rows:
-    #     product_context += (
-    #         f"Product: {product.style_name}, SKU: {product.sku}, Collection: {product.collection_name}, "
-    #         f"Color: {product.marketing_color_name}, Construction: {product.construction}, "
-    #         f"Backing: {product.backing_description}\n"
-    #     )
-
-    # Step 4: Combine into one prompt context
-    full_context = f"== BROCHURE CONTEXT ==\n{brochure_context}\n\n== PRODUCT METADATA ==\n{product_context}"
-    # print(f'full_context ==> {full_context}')
-
-    # Optional: Trimming context if too long
-    max_context_length = 1500
-    if len(full_context.split()) > max_context_length:
-        full_context = ' '.join(full_context.split()[:max_context_length])
-
-    # GPT system prompt
-    system_prompt = (
-        "You are a helpful flooring advisor. "
-        "Answer user questions using the provided context. "
-        "Include key product details: name, SKU, collection, color, backing, construction, and product URL if available. "
-        "Also show product thumbnails using Markdown `![image](url)` syntax. "
-        "When responding, format your answer using Markdown. "
-        "Use **bold**, *italics*, bullet points, numbered lists, and section headings (###) where appropriate. "
-        "Your output will be displayed in a web UI that supports Markdown rendering via marked.js."
+def build_async_retrieval_graph(user_input, index_name, embedding):
+    # Same shape as build_retrieval_graph. Each DB stage opens its own
+    # AsyncSession because a session can't be shared by concurrent tasks.
+    async def search():
+        vector_query = VectorizedQuery(vector=embedding, k_nearest_neighbors=SEARCH_TOP_K, fields="embedding")
+        top_chunks = await asearch_similar_content(vector_query, index_name, top_k=SEARCH_TOP_K, query_text=user_input)
+        print(f'Top chunks from Azure Search ==> {len(top_chunks)}')
+        return top_chunks
+
+    async def filters():
+        structured = add_classification_filter(await aextract_structured_filters(user_input, index_name), index_name)
+        print(f"Structured Filters: {structured}")
+        return structured
+
+    async def products(filters):
+        async with get_async_db() as db:
+            product_rows = await asearch_product_metadata(db, filters, 10)
+        print(f"product_rows: {product_rows}")
+        return product_rows
+
+    async def fallback_products(products, search, filters):
+        if products:
+            return products
+        fallback_filters = infer_fallback_filters("\n\n".join(search), filters)
+        if not fallback_filters:
+            return products
+        async with get_async_db() as db:
+            product_rows = await asearch_product_metadata(db, fallback_filters, 10)
+        print(f"fallback product_rows: {product_rows}")
+        return product_rows
+
+    return (
+        StageGraph()
+        .add("search", search)
+        .add("filters", filters)
+        .add("products", products, deps=["filters"])
+        .add("fallback_products", fallback_products, deps=["products", "search", "filters"])
     )
 
+def answer_version(index_name, products_version):
+    # Cached answers quote both the Crest catalog file and the products table;
+    # both versions are shared by every worker process
+    return f"{get_catalog(index_name).version}|{products_version}"
+
+def answer_key(user_input, index_name):
+    # Catalog terms and code-like tokens (SKUs, style numbers) the question
+    # names; a cached answer only serves a question naming the same ones
+    filters, _ = extract_local_filters(user_input, index_name)
+    codes = sorted({token for token in tokenize(user_input) if any(c.isdigit() for c in token)})
+    return json.dumps([filters, codes], sort_keys=True, default=str)
+
+def chat_with_gpt(user_input, index_name):
+    print(f'User input ==> {user_input} & index_name ==> {index_name}')
+    embedding = query_vector(generate_embeddings(user_input, os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")))
+    version = answer_version(index_name, product_version())
+    key = answer_key(user_input, index_name)
+    cached = answer_cache.get(index_name, embedding, version, key)
+    if cached is not None:
+        print("[Answer cache] hit")
+        return cached["reply"]
+
+    retrieval = build_retrieval_graph(user_input, index_name, embedding).run()
+    print(f"[Pipeline] {retrieval.summary()}")
+    product_rows = retrieval["fallback_products"]
+
     # Ask GPT
     chat_response = client.chat.completions.create(
         model=os.getenv("AZURE_OPENAI_GPT_DEPLOYMENT_NAME"),
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Use this context: {full_context}\n\nQuestion: {user_input}"}
-        ],
+        messages=build_chat_messages(user_input, index_name, retrieval["search"], product_rows),
+        max_tokens=1024
+    )
+
+    reply = chat_response.choices[0].message.content
+    answer_cache.set(index_name, embedding, {"reply": reply, "products": [row.sku for row in product_rows]}, version, key)
+    return reply
+
+async def achat_with_gpt(user_input, index_name):
+    # Same pipeline as chat_with_gpt, but every network and DB call is awaited
+    print(f'User input ==> {user_input} & index_name ==> {index_name}')
+    embedding = query_vector(await agenerate_embeddings(user_input, os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")))
+    version = answer_version(index_name, await aproduct_version())
+    key = answer_key(user_input, index_name)
+    cached = answer_cache.get(index_name, embedding, version, key)
+    if cached is not None:
+        print("[Answer cache] hit")
+        return cached["reply"]
+
+    retrieval = await build_async_retrieval_graph(user_input, index_name, embedding).arun()
+    print(f"[Pipeline] {retrieval.summary()}")
+    product_rows = retrieval["fallback_products"]
+
+    chat_response = await async_client.chat.completions.create(
+        model=os.getenv("AZURE_OPENAI_GPT_DEPLOYMENT_NAME"),
+        messages=build_chat_messages(user_input, index_name, retrieval["search"], product_rows),
         max_tokens=1024
     )
 
-    return chat_response.choices[0].message.content
\ No newline at end of file
+    reply = chat_response.choices[0].message.content
+    answer_cache.set(index_name, embedding, {"reply": reply, "products": [row.sku for row in product_rows]}, version, key)
+    return reply
+
+async def astream_chat_with_gpt(user_input, index_name):
+    # Yields {"type": "delta", "content"} events as the completion streams in,
+    # then one {"type": "done"} event with the products and stage timings
+    print(f'User input ==> {user_input} & index_name ==> {index_name}')
+    t0 = time.perf_counter()
+    embedding = query_vector(await agenerate_embeddings(user_input, os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")))
+    embed_ms = (time.perf_counter() - t0) * 1000
+    version = answer_version(index_name, await aproduct_version())
+    key = answer_key(user_input, index_name)
+
+    cached = answer_cache.get(index_name, embedding, version, key)
+    if cached is not None:
+        print("[Answer cache] hit")
+        yield {"type": "delta", "content": cached["reply"]}
+        total_ms = round((time.perf_counter() - t0) * 1000, 1)
+        yield {
+            "type": "done",
+            "products": cached["products"],
+            "cached": True,
+            "timings": {"embed": round(embed_ms, 1), "first_token": total_ms, "total": total_ms},
+        }
+        return
+
+    retrieval = await build_async_retrieval_graph(user_input, index_name, embedding).arun()
+    print(f"[Pipeline] {retrieval.summary()}")
+    product_rows = retrieval["fallback_products"]
+
+    completion_start = time.perf_counter()
+    first_token_ms = None
+    parts = []
+    stream = await async_client.chat.completions.create(
+        model=os.getenv("AZURE_OPENAI_GPT_DEPLOYMENT_NAME"),
+        messages=build_chat_messages(user_input, index_name, retrieval["search"], product_rows),
+        max_tokens=1024,
+        stream=True
+    )
+    async for chunk in stream:
+        # Azure sends content-filter results in chunks without choices
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content
+        if content:
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - t0) * 1000
+            parts.append(content)
+            yield {"type": "delta", "content": content}
+
+    products = [row.sku for row in product_rows]
+    answer_cache.set(index_name, embedding, {"reply": "".join(parts), "products": products}, version, key)
+
+    timings = {"embed": round(embed_ms, 1)}
+    timings.update({name: round(t["duration_ms"], 1) for name, t in retrieval.timings.items()})
+    timings["retrieval"] = round(retrieval.elapsed_ms, 1)
+    timings["completion"] = round((time.perf_counter() - completion_start) * 1000, 1)
+    timings["first_token"] = round(first_token_ms, 1) if first_token_ms is not None else None
+    timings["total"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    yield {
+        "type": "done",
+        "products": products,
+        "cached": False,
+        "timings": timings,
+    }
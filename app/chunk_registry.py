@@ -0,0 +1,279 @@
+# app/chunk_registry.py
+
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from app.context_builder import shingles
+from app.ingest_manifest import chunk_doc_id
+from dotenv import load_dotenv
+load_dotenv()
+
+# Ingest-time near-duplicate detection for brochure chunks. Every stored
+# chunk keeps a MinHash signature of its word shingles, bucketed by LSH
+# bands, in a SQLite file next to the other caches. Before a PDF is embedded
+# each of its chunks is checked against the whole index (and the chunks
+# before it in the same PDF): a chunk whose estimated Jaccard similarity to
+# a stored one reaches CHUNK_DEDUP_THRESHOLD is not embedded or uploaded
+# again, it is recorded as another source of the stored chunk instead.
+#
+# 128 hashes in 16 bands of 8 rows: pairs above ~0.7 similarity land in a
+# shared bucket with high probability; the threshold check on the full
+# signature decides.
+
+CHUNK_REGISTRY_PATH = os.getenv("CHUNK_REGISTRY_PATH", "data/cache/chunk_registry.sqlite3")
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "1") == "1"
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.85"))
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)  # fixed: signatures must be stable across runs
+_A = _rng.integers(1, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def minhash(text):
+    grams = shingles(text)
+    if not grams:
+        return None
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") % _PRIME for g in grams),
+        dtype=np.uint64, count=len(grams),
+    )
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature):
+    return [
+        hashlib.blake2b(signature[b * LSH_ROWS:(b + 1) * LSH_ROWS].tobytes(), digest_size=8).hexdigest()
+        for b in range(LSH_BANDS)
+    ]
+
+
+def similarity(a, b):
+    return float(np.mean(a == b))
+
+
+class IngestPlan:
+    # Outcome of checking one PDF's chunks against the registry
+    def __init__(self, pdf_name, total, positions, kept=None):
+        self.pdf_name = pdf_name
+        self.total = total          # chunk count of the brochure as parsed now
+        self.positions = positions  # positions this plan covers (changed ones)
+        self.kept = kept or {}      # {position: doc id} of unchanged chunks, possibly moved
+        self.new = []         # [(chunk position, doc id, signature)] to embed and upload
+        self.duplicates = []  # [(chunk position, doc id of the stored copy, similarity)]
+
+    @property
+    def new_positions(self):
+        return [pos for pos, _, _ in self.new]
+
+    @property
+    def new_ids(self):
+        return [doc_id for _, doc_id, _ in self.new]
+
+    def keep_only(self, doc_ids):
+        # Forget new chunks that never made it into the vector store, and the
+        # duplicates of them (later repeats in this PDF) along with them
+        doc_ids = set(doc_ids)
+        missing = {doc_id for _, doc_id, _ in self.new} - doc_ids
+        self.new = [entry for entry in self.new if entry[1] in doc_ids]
+        self.duplicates = [entry for entry in self.duplicates if entry[1] not in missing]
+
+
+class ChunkRegistry:
+    def __init__(self, path=CHUNK_REGISTRY_PATH, threshold=CHUNK_DEDUP_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "index_name TEXT NOT NULL, doc_id TEXT NOT NULL, signature BLOB NOT NULL, "
+                "PRIMARY KEY (index_name, doc_id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS bands ("
+                "index_name TEXT NOT NULL, band INTEGER NOT NULL, bucket TEXT NOT NULL, doc_id TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands(index_name, band, bucket)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_doc ON bands(index_name, doc_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                "index_name TEXT NOT NULL, doc_id TEXT NOT NULL, pdf_name TEXT NOT NULL, position INTEGER NOT NULL, "
+                "own INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (index_name, pdf_name, position))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sources_doc ON sources(index_name, doc_id)")
+            # Registries written before content ids: own rows had positional ids
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sources)")]
+            if "own" not in columns:
+                self._conn.execute("ALTER TABLE sources ADD COLUMN own INTEGER NOT NULL DEFAULT 1")
+                self._conn.execute("UPDATE sources SET own = (doc_id = pdf_name || '-' || position)")
+                self._conn.commit()
+        return self._conn
+
+    def _stored_match(self, db, index_name, signature, keys, own_ids):
+        candidates = set()
+        for band, bucket in enumerate(keys):
+            rows = db.execute(
+                "SELECT doc_id FROM bands WHERE index_name = ? AND band = ? AND bucket = ?",
+                (index_name, band, bucket),
+            ).fetchall()
+            candidates.update(doc_id for (doc_id,) in rows if doc_id not in own_ids)
+        best = None
+        for doc_id in candidates:
+            row = db.execute(
+                "SELECT signature FROM chunks WHERE index_name = ? AND doc_id = ?", (index_name, doc_id)
+            ).fetchone()
+            score = similarity(signature, np.frombuffer(row[0], dtype=np.uint32))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (doc_id, score)
+        return best
+
+    def plan(self, index_name, pdf_name, texts, hashes, positions=None, kept=None):
+        # Doc ids are content-addressed (see chunk_doc_id), so a stored chunk
+        # is never overwritten with different text while other brochures
+        # point at it. positions limits the plan to changed chunks; kept maps
+        # the other positions to the doc ids they keep.
+        positions = list(range(len(texts))) if positions is None else sorted(positions)
+        plan = IngestPlan(pdf_name, len(texts), positions, kept)
+        batch = {}  # (band, bucket) -> [(doc id, signature)] for earlier chunks of this PDF
+        planned = set()
+        with self._lock:
+            db = self._db()
+            # Own chunks that are not kept are re-stored or dropped, so they
+            # can't serve as the stored copy
+            own_ids = {
+                doc_id for (doc_id,) in db.execute(
+                    "SELECT doc_id FROM sources WHERE index_name = ? AND pdf_name = ? AND own = 1",
+                    (index_name, pdf_name),
+                )
+            } - set(plan.kept.values())
+            for pos in positions:
+                doc_id = chunk_doc_id(pdf_name, hashes[pos])
+                if doc_id in planned:
+                    # Same text earlier in this PDF
+                    plan.duplicates.append((pos, doc_id, 1.0))
+                    continue
+                signature = minhash(texts[pos]) if CHUNK_DEDUP else None
+                if signature is None:
+                    plan.new.append((pos, doc_id, signature))
+                    planned.add(doc_id)
+                    continue
+                keys = band_keys(signature)
+
+                match = self._stored_match(db, index_name, signature, keys, own_ids)
+                for band, bucket in enumerate(keys):
+                    for other_id, other_signature in batch.get((band, bucket), ()):
+                        score = similarity(signature, other_signature)
+                        if score >= self.threshold and (match is None or score > match[1]):
+                            match = (other_id, score)
+
+                if match is not None:
+                    plan.duplicates.append((pos, match[0], match[1]))
+                    continue
+                plan.new.append((pos, doc_id, signature))
+                planned.add(doc_id)
+                for band, bucket in enumerate(keys):
+                    batch.setdefault((band, bucket), []).append((doc_id, signature))
+        return plan
+
+    def commit(self, index_name, plan):
+        # Call once the new chunks are in the vector store. Plans of
+        # brochures in flight at the same time are made against the same
+        # committed state: a duplicate whose stored copy another brochure
+        # released (stale delete) in the meantime is dropped here, and its
+        # position is retried next run.
+        with self._lock:
+            db = self._db()
+            new_ids = {doc_id for _, doc_id, _ in plan.new}
+            gone = {
+                doc_id for _, doc_id, _ in plan.duplicates
+                if doc_id not in new_ids and db.execute(
+                    "SELECT 1 FROM chunks WHERE index_name = ? AND doc_id = ?", (index_name, doc_id)
+                ).fetchone() is None
+            }
+            if gone:
+                print(f"[Dedup] {plan.pdf_name}: {len(gone)} stored copies were removed meanwhile, retrying next run")
+                plan.duplicates = [entry for entry in plan.duplicates if entry[1] not in gone]
+            # Sources are rewritten for the whole brochure: kept chunks may
+            # have moved to other positions
+            own = {}
+            for doc_id, flag in db.execute(
+                "SELECT doc_id, own FROM sources WHERE index_name = ? AND pdf_name = ?", (index_name, plan.pdf_name)
+            ):
+                own[doc_id] = max(own.get(doc_id, 0), flag)
+            db.execute("DELETE FROM sources WHERE index_name = ? AND pdf_name = ?", (index_name, plan.pdf_name))
+            db.executemany(
+                "INSERT INTO sources (index_name, doc_id, pdf_name, position, own) VALUES (?, ?, ?, ?, ?)",
+                [(index_name, doc_id, plan.pdf_name, pos, own.get(doc_id, 0)) for pos, doc_id in plan.kept.items()],
+            )
+            for pos, doc_id, signature in plan.new:
+                db.execute("DELETE FROM bands WHERE index_name = ? AND doc_id = ?", (index_name, doc_id))
+                if signature is not None:
+                    db.execute(
+                        "INSERT OR REPLACE INTO chunks (index_name, doc_id, signature) VALUES (?, ?, ?)",
+                        (index_name, doc_id, signature.tobytes()),
+                    )
+                    db.executemany(
+                        "INSERT INTO bands (index_name, band, bucket, doc_id) VALUES (?, ?, ?, ?)",
+                        [(index_name, band, bucket, doc_id) for band, bucket in enumerate(band_keys(signature))],
+                    )
+                db.execute(
+                    "INSERT OR REPLACE INTO sources (index_name, doc_id, pdf_name, position, own) VALUES (?, ?, ?, ?, 1)",
+                    (index_name, doc_id, plan.pdf_name, pos),
+                )
+            for pos, doc_id, _ in plan.duplicates:
+                db.execute(
+                    "INSERT OR REPLACE INTO sources (index_name, doc_id, pdf_name, position, own) VALUES (?, ?, ?, ?, 0)",
+                    (index_name, doc_id, plan.pdf_name, pos),
+                )
+            db.commit()
+
+    def release(self, index_name, doc_ids):
+        # Forgets the doc_ids no brochure position points at any more and
+        # returns them, for the caller to delete from the vector store. Check
+        # and forget happen under one lock, so a concurrent commit either
+        # lands first (and keeps its chunk) or sees it gone.
+        with self._lock:
+            db = self._db()
+            unreferenced = {
+                doc_id for doc_id in doc_ids
+                if not db.execute(
+                    "SELECT 1 FROM sources WHERE index_name = ? AND doc_id = ? LIMIT 1", (index_name, doc_id)
+                ).fetchone()
+            }
+            for doc_id in unreferenced:
+                db.execute("DELETE FROM chunks WHERE index_name = ? AND doc_id = ?", (index_name, doc_id))
+                db.execute("DELETE FROM bands WHERE index_name = ? AND doc_id = ?", (index_name, doc_id))
+            db.commit()
+        return unreferenced
+
+    def sources(self, index_name, doc_id):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT pdf_name FROM sources WHERE index_name = ? AND doc_id = ? ORDER BY pdf_name",
+                (index_name, doc_id),
+            ).fetchall()
+        return sorted({pdf_name for (pdf_name,) in rows})
+
+    def stats(self):
+        with self._lock:
+            db = self._db()
+            chunks = db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            sources = db.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+            shared = db.execute("SELECT COUNT(*) FROM sources WHERE own = 0").fetchone()[0]
+        return {"stored_chunks": chunks, "chunk_sources": sources, "deduplicated": shared}
+
+
+chunk_registry = ChunkRegistry()
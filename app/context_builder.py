@@ -0,0 +1,177 @@
+# app/context_builder.py
+
+import os
+import re
+import threading
+from app.tokens import count_tokens
+from dotenv import load_dotenv
+load_dotenv()
+
+# Assembles the chat prompt context under a token budget. Products and
+# brochure chunks get separate budgets so a long brochure can never push the
+# product metadata out; whatever the products leave unused goes to the
+# brochure.
+#
+# Brochure chunks arrive best first. They are picked with maximal marginal
+# relevance over word-shingle overlap, so a chunk that mostly repeats one
+# already picked (neighbouring splitter chunks share chunk_overlap chars,
+# the same spec table appears in several brochures) loses to a new one.
+# The text a chunk shares with the end of a picked chunk is cut off too.
+
+CONTEXT_BROCHURE_TOKENS = int(os.getenv("CONTEXT_BROCHURE_TOKENS", "1500"))
+CONTEXT_PRODUCT_TOKENS = int(os.getenv("CONTEXT_PRODUCT_TOKENS", "800"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 3
+MIN_OVERLAP_CHARS = 20
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text):
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def strip_overlap(chunk, picked):
+    # Drop the prefix of chunk that repeats the tail of an already picked chunk
+    head = chunk[:MIN_OVERLAP_CHARS]
+    if len(head) < MIN_OVERLAP_CHARS:
+        return chunk
+    best = 0
+    for other in picked:
+        # The earliest match of head in other's tail is the longest overlap
+        pos = other.find(head, max(0, len(other) - len(chunk)))
+        while pos != -1:
+            if chunk.startswith(other[pos:]):
+                best = max(best, len(other) - pos)
+                break
+            pos = other.find(head, pos + 1)
+    return chunk[best:].lstrip() if best else chunk
+
+
+def select_chunks(chunks, budget, mmr_lambda=CONTEXT_MMR_LAMBDA, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    # -> (picked chunks, tokens used, dropped as duplicates, dropped for budget)
+    candidates = []
+    for rank, chunk in enumerate(c for c in chunks if c and c.strip()):
+        candidates.append({"text": chunk, "relevance": 1.0 / (rank + 1), "shingles": shingles(chunk)})
+
+    picked, picked_shingles = [], []
+    used = duplicates = over_budget = 0
+    while candidates:
+        best, best_score, best_similarity = None, None, 0.0
+        for candidate in candidates:
+            similarity = max((jaccard(candidate["shingles"], s) for s in picked_shingles), default=0.0)
+            score = mmr_lambda * candidate["relevance"] - (1 - mmr_lambda) * similarity
+            if best_score is None or score > best_score:
+                best, best_score, best_similarity = candidate, score, similarity
+        candidates.remove(best)
+
+        if best_similarity >= duplicate_threshold:
+            duplicates += 1
+            continue
+        text = strip_overlap(best["text"], picked)
+        tokens = count_tokens(text)
+        if not text or used + tokens > budget:
+            over_budget += 1
+            continue
+        picked.append(text)
+        picked_shingles.append(best["shingles"])
+        used += tokens
+    return picked, used, duplicates, over_budget
+
+
+def select_products(product_blocks, budget):
+    # Product blocks are kept in ranking order until the budget runs out;
+    # the first one always goes in so the model sees at least one product
+    picked, used = [], 0
+    for block in product_blocks:
+        tokens = count_tokens(block)
+        if picked and used + tokens > budget:
+            break
+        picked.append(block)
+        used += tokens
+    return picked, used
+
+
+class ContextReport:
+    # Running totals of what the context builder kept and dropped
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.brochure_tokens = 0
+        self.product_tokens = 0
+        self.chunks_in = 0
+        self.chunks_kept = 0
+        self.duplicates_dropped = 0
+        self.products_in = 0
+        self.products_kept = 0
+
+    def record(self, context):
+        with self._lock:
+            self.calls += 1
+            self.brochure_tokens += context.brochure_tokens
+            self.product_tokens += context.product_tokens
+            self.chunks_in += context.chunks_in
+            self.chunks_kept += len(context.chunks)
+            self.duplicates_dropped += context.duplicates_dropped
+            self.products_in += context.products_in
+            self.products_kept += len(context.products)
+
+    def stats(self):
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "avg_brochure_tokens": round(self.brochure_tokens / calls, 1),
+            "avg_product_tokens": round(self.product_tokens / calls, 1),
+            "chunks_kept_rate": round(self.chunks_kept / self.chunks_in, 4) if self.chunks_in else 0.0,
+            "duplicates_dropped": self.duplicates_dropped,
+            "products_kept_rate": round(self.products_kept / self.products_in, 4) if self.products_in else 0.0,
+        }
+
+
+context_report = ContextReport()
+
+
+class PromptContext:
+    def __init__(self, chunks, products, brochure_tokens, product_tokens, chunks_in, products_in, duplicates_dropped):
+        self.chunks = chunks
+        self.products = products
+        self.brochure_tokens = brochure_tokens
+        self.product_tokens = product_tokens
+        self.chunks_in = chunks_in
+        self.products_in = products_in
+        self.duplicates_dropped = duplicates_dropped
+
+    def render(self):
+        brochure = "\n\n".join(self.chunks)
+        products = "".join(self.products)
+        return f"== BROCHURE CONTEXT ==\n{brochure}\n\n== PRODUCT METADATA ==\n{products}"
+
+    def summary(self):
+        return (
+            f"brochure {len(self.chunks)}/{self.chunks_in} chunks, {self.brochure_tokens} tokens "
+            f"({self.duplicates_dropped} duplicates dropped) | "
+            f"products {len(self.products)}/{self.products_in}, {self.product_tokens} tokens"
+        )
+
+
+def build_context(brochure_chunks, product_blocks,
+                  brochure_budget=CONTEXT_BROCHURE_TOKENS, product_budget=CONTEXT_PRODUCT_TOKENS):
+    products, product_tokens = select_products(product_blocks, product_budget)
+    spare = max(0, product_budget - product_tokens)
+    chunks, brochure_tokens, duplicates, _ = select_chunks(brochure_chunks, brochure_budget + spare)
+    context = PromptContext(
+        chunks, products, brochure_tokens, product_tokens,
+        chunks_in=len(brochure_chunks), products_in=len(product_blocks), duplicates_dropped=duplicates,
+    )
+    context_report.record(context)
+    return context
@@ -0,0 +1,60 @@
+# app/db/data_version.py
+
+import os
+import time
+import threading
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.db.database import SessionLocal, get_async_db
+from app.db.models.data_version import DataVersion
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shared version counter for the products table. Every product write bumps it
+# in the same transaction, and chat puts it in the answer-cache version, so
+# every worker process (and host) misses after a write, not only the one
+# that handled it. Reads are memoized for PRODUCT_VERSION_TTL seconds to keep
+# the extra query off most chat requests.
+
+PRODUCTS = "products"
+PRODUCT_VERSION_TTL = float(os.getenv("PRODUCT_VERSION_TTL", "2"))
+
+_cached = {"version": None, "expires": 0.0}
+_lock = threading.Lock()
+
+def bump_product_version(db: Session):
+    # Call inside the write's transaction, before commit
+    updated = db.execute(
+        update(DataVersion).where(DataVersion.name == PRODUCTS).values(version=DataVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.add(DataVersion(name=PRODUCTS, version=1))
+    with _lock:
+        _cached["expires"] = 0.0
+
+def _remember(version):
+    with _lock:
+        _cached["version"] = version or 0
+        _cached["expires"] = time.monotonic() + PRODUCT_VERSION_TTL
+    return version or 0
+
+def _fresh():
+    with _lock:
+        if _cached["version"] is not None and time.monotonic() < _cached["expires"]:
+            return _cached["version"]
+    return None
+
+def product_version():
+    cached = _fresh()
+    if cached is not None:
+        return cached
+    with SessionLocal() as db:
+        return _remember(db.execute(select(DataVersion.version).where(DataVersion.name == PRODUCTS)).scalar())
+
+async def aproduct_version():
+    cached = _fresh()
+    if cached is not None:
+        return cached
+    async with get_async_db() as db:
+        result = await db.execute(select(DataVersion.version).where(DataVersion.name == PRODUCTS))
+        return _remember(result.scalar())
@@ -1,9 +1,14 @@
 # app/db/database.py
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
 import os
+import ssl
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -13,9 +18,78 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Map the sync driver in DATABASE_URL to its async counterpart
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# libpq query parameters asyncpg doesn't accept; sslmode/sslrootcert/
+# connect_timeout/application_name are translated to connect_args below
+LIBPQ_ONLY_PARAMS = {
+    "sslmode", "sslrootcert", "sslcert", "sslkey", "sslcrl", "sslcompression", "sslpassword",
+    "connect_timeout", "application_name", "options", "gssencmode", "target_session_attrs",
+    "keepalives", "keepalives_idle", "keepalives_interval", "keepalives_count", "client_encoding",
+}
+
+def asyncpg_ssl(params):
+    # asyncpg takes the libpq sslmode names as-is; a CA or client cert needs an SSLContext
+    mode = params.get("sslmode")
+    if not any(params.get(key) for key in ("sslrootcert", "sslcert")):
+        return mode
+    context = ssl.create_default_context(cafile=params.get("sslrootcert"))
+    if mode != "verify-full":
+        context.check_hostname = False
+    if mode in (None, "disable", "allow", "prefer", "require") and not params.get("sslrootcert"):
+        context.verify_mode = ssl.CERT_NONE
+    if params.get("sslcert"):
+        context.load_cert_chain(params["sslcert"], params.get("sslkey"))
+    return context
+
+def get_async_database_url(url):
+    # -> (async url, connect_args)
+    scheme, sep, rest = url.partition("://")
+    async_url = make_url(f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}")
+    if async_url.drivername != "postgresql+asyncpg":
+        return async_url, {}
+    params = dict(async_url.query)
+    connect_args = {}
+    ssl_arg = asyncpg_ssl(params)
+    if ssl_arg is not None:
+        connect_args["ssl"] = ssl_arg
+    if params.get("connect_timeout"):
+        connect_args["timeout"] = float(params["connect_timeout"])
+    if params.get("application_name"):
+        connect_args["server_settings"] = {"application_name": params["application_name"]}
+    return async_url.difference_update_query(LIBPQ_ONLY_PARAMS), connect_args
+
+# Built on first use, not at import: a bad async URL, driver or SSL file
+# then fails the async callers only instead of the whole app
+_async_sessionmaker = None
+_async_lock = threading.Lock()
+
+def get_async_sessionmaker():
+    global _async_sessionmaker
+    with _async_lock:
+        if _async_sessionmaker is None:
+            if os.getenv("ASYNC_DATABASE_URL"):
+                url, connect_args = os.getenv("ASYNC_DATABASE_URL"), {}
+            else:
+                url, connect_args = get_async_database_url(DATABASE_URL)
+            async_engine = create_async_engine(url, connect_args=connect_args)
+            _async_sessionmaker = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        return _async_sessionmaker
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+@asynccontextmanager
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -0,0 +1,10 @@
+# app/db/models/data_version.py
+
+from sqlalchemy import Column, Integer, String
+from app.db.database import Base
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -1,11 +1,11 @@
 # app/db/product_metadata.py
 
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select
 from app.db.models.product import Product
 
-def search_product_metadata(session: Session, filters: dict, limit=5):
-    print(f"[DB] Searching with filters: {filters}")
+def build_filter_conditions(filters: dict):
     conditions = []
     for field, value in filters.items():
         if hasattr(Product, field):
@@ -14,8 +14,23 @@ def search_product_metadata(session: Session, filters: dict, limit=5):
                 conditions.append(column_attr.in_(value))  # Handle list values
             else:
                 conditions.append(column_attr.ilike(f"%{value}%"))  # Handle string values
+    return conditions
+
+def search_product_metadata(session: Session, filters: dict, limit=5):
+    print(f"[DB] Searching with filters: {filters}")
+    conditions = build_filter_conditions(filters)
 
     if not conditions:
         return []
 
     return session.query(Product).filter(and_(*conditions)).limit(limit).all()
+
+async def asearch_product_metadata(session: AsyncSession, filters: dict, limit=5):
+    print(f"[DB] Searching with filters: {filters}")
+    conditions = build_filter_conditions(filters)
+
+    if not conditions:
+        return []
+
+    result = await session.execute(select(Product).where(and_(*conditions)).limit(limit))
+    return result.scalars().all()
@@ -0,0 +1,200 @@
+# app/download_cache.py
+
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from app.batching import call_with_retry
+from dotenv import load_dotenv
+load_dotenv()
+
+# Content-addressed on-disk cache for remote brochures and spreadsheets.
+# Bodies are stored once per sha256 under <dir>/blobs/; a SQLite index maps
+# each URL to its blob plus the ETag / Last-Modified the server sent. A
+# cached URL is revalidated with a conditional GET, so an unchanged file
+# costs one 304 round trip instead of a full download. Least recently used
+# URLs are evicted once the blobs exceed DOWNLOAD_CACHE_MAX_BYTES.
+#
+# Safe to share between the bulk pipeline's worker processes: blobs are
+# written to a temp file and renamed into place, index writes are short
+# SQLite transactions.
+
+DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "data/cache/downloads")
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "60"))
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def is_remote(path):
+    return path.startswith(("http://", "https://"))
+
+
+class DownloadCache:
+    def __init__(self, root=DOWNLOAD_CACHE_DIR, max_bytes=DOWNLOAD_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._session = None
+        self.hits = 0         # served from disk after a 304
+        self.downloads = 0    # full bodies transferred
+        self.bytes_downloaded = 0
+        self.stale_served = 0
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, etag TEXT, last_modified TEXT, "
+                "fetched_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_sha ON entries(sha256)")
+        return self._conn
+
+    def _get_session(self):
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, "blobs", sha256[:2], sha256)
+
+    def _lookup(self, url):
+        with self._lock:
+            row = self._db().execute(
+                "SELECT sha256, etag, last_modified FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        return row
+
+    def _touch(self, url):
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+            db.commit()
+
+    def _store(self, url, response):
+        # Stream the body to a temp file, hashing as we go, then move it into place
+        digest = hashlib.sha256()
+        size = 0
+        blobs = os.path.join(self.root, "blobs")
+        fd, tmp_path = tempfile.mkstemp(dir=blobs, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            previous = db.execute("SELECT sha256 FROM entries WHERE url = ?", (url,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (url, sha256, size, etag, last_modified, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, sha256, size, response.headers.get("ETag"), response.headers.get("Last-Modified"), now, now),
+            )
+            if previous and previous[0] != sha256:
+                self._drop_unreferenced(db, previous[0])
+            self._evict(db, keep=url)
+            db.commit()
+            self.downloads += 1
+            self.bytes_downloaded += size
+        return path
+
+    def _drop_unreferenced(self, db, sha256):
+        if db.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone() is None:
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, db, keep=None):
+        # Blob bytes, counting each distinct body once
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)").fetchone()[0]
+        while total > self.max_bytes:
+            row = db.execute(
+                "SELECT url, sha256, size FROM entries WHERE url != ? ORDER BY last_access LIMIT 1", (keep or "",)
+            ).fetchone()
+            if row is None:
+                break
+            url, sha256, size = row
+            db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            if db.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone() is None:
+                self._drop_unreferenced(db, sha256)
+                total -= size
+
+    def fetch(self, url):
+        # -> local file path holding the current body of url
+        cached = self._lookup(url)
+        headers = {}
+        if cached is not None:
+            sha256, etag, last_modified = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        try:
+            response = call_with_retry(
+                self._get_session().get, url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT
+            )
+        except requests.RequestException as e:
+            if cached is None:
+                raise
+            print(f"[Download cache] {url}: {e}; using cached copy")
+            self.stale_served += 1
+            self._touch(url)
+            return self.blob_path(cached[0])
+
+        with response:
+            if cached is not None and response.status_code == 304:
+                self.hits += 1
+                self._touch(url)
+                return self.blob_path(cached[0])
+            response.raise_for_status()
+            return self._store(url, response)
+
+    def read_bytes(self, url):
+        with open(self.fetch(url), "rb") as f:
+            return f.read()
+
+    def stats(self):
+        with self._lock:
+            db = self._db()
+            entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)").fetchone()[0]
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "revalidated_hits": self.hits,
+            "downloads": self.downloads,
+            "bytes_downloaded": self.bytes_downloaded,
+            "stale_served": self.stale_served,
+        }
+
+
+download_cache = DownloadCache()
@@ -1,15 +1,22 @@
 # app/embedding.py
 
 import os
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from openai import AzureOpenAI
-import numpy as np
-from app.azure_search import upload_documents_to_search
+from app.vector_store import upload_documents_to_search, delete_documents_from_search
+from app.embedding_profile import SOURCE_EMBEDDING_DIM, get_embedding_profile
+from app.chunk_registry import chunk_registry
+from app.ingest_manifest import ingest_manifest, chunk_hash
+from app.embedding_batcher import EmbeddingBatcher
+from app.download_cache import download_cache, is_remote
+from app.pdf_extract import extract_pages
 from dotenv import load_dotenv
 load_dotenv()
 
-EMBEDDING_DIM = 3072 # For text-embedding-3-large
+EMBEDDING_DIM = SOURCE_EMBEDDING_DIM # For text-embedding-3-large
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
 
 client = AzureOpenAI(
     api_version=os.getenv("AZURE_OPENAI_EMBEDDING_API_VERSION"),
@@ -17,41 +24,140 @@ client = AzureOpenAI(
     api_key=os.getenv("AZURE_OPENAI_API_KEY")
 )
 
-def process_pdf(pdf_path: str, index_name: str):
-    try:
-        pdf_name = os.path.basename(pdf_path).replace(".pdf", "")
-        loader = PyPDFLoader(pdf_path)
-        documents = loader.load()
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        chunks = splitter.split_documents(documents)
+def chunk_settings():
+    # Anything that changes a stored vector invalidates the chunk hashes
+    profile = get_embedding_profile()
+    deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
+    return f"{CHUNK_SIZE}/{CHUNK_OVERLAP}|{deployment}|{profile.dimensions}/{profile.quantization}"
 
-        texts = [doc.page_content for doc in chunks if doc.page_content.strip()]
-        metadata = [doc.metadata for doc in chunks if doc.page_content.strip()]
+def remove_stale_chunks(index_name, diff, doc_ids):
+    # Chunks the last run mapped to that no position maps to any more, and
+    # that no brochure (this one or another, through dedup) still points at,
+    # are deleted
+    stale = chunk_registry.release(index_name, diff.previous_ids() - set(doc_ids.values()))
+    if stale:
+        delete_documents_from_search(index_name, sorted(stale))
+        print(f"[Manifest] {diff.pdf_name}: deleted {len(stale)} stale chunks")
+    return len(stale)
 
-        if not texts:
-            return {"status": "error", "message": "No valid text chunks to embed."}
+class IngestJob:
+    # One brochure moving through parse -> plan -> embed -> upload; process_pdf
+    # runs the steps back to back, the bulk pipeline runs them as stages
+    def __init__(self, pdf_path, index_name, pdf_name, texts, metadata, force=False):
+        self.pdf_path = pdf_path
+        self.index_name = index_name
+        self.pdf_name = pdf_name
+        self.texts = texts
+        self.metadata = metadata
+        self.force = force
+        self.diff = None
+        self.plan = None
+        self.doc_ids = {}  # position -> doc id serving it once stored
+        self.vectors = []
+        self.clean_texts = []
+        self.clean_metadata = []
+        self.clean_ids = []
+        self.embedding_report = None
+        self.upload_report = None
+        self.deleted = 0
 
-        response = client.embeddings.create(
-            input=texts,
-            model=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
-        )
+    def result(self):
+        failed = len(self.texts) - len(self.doc_ids)
+        return {
+            "status": "partial" if failed else "embedded",
+            "chunks": len(self.plan.new),
+            "unchanged": len(self.texts) - len(self.plan.positions),
+            "failed": failed,
+            "duplicates": len(self.plan.duplicates),
+            "deleted": self.deleted,
+            "embedding": self.embedding_report.to_dict() if self.embedding_report else None,
+            "upload": self.upload_report.to_dict() if self.upload_report else None,
+        }
+
+def parse_pdf(pdf_path):
+    # CPU-bound and picklable in and out, so the bulk pipeline can run it in
+    # a worker process
+    pdf_name = os.path.basename(pdf_path).replace(".pdf", "")
+    # Remote brochures come from the download cache (conditional GET) instead
+    # of being downloaded again on every run
+    local_path = download_cache.fetch(pdf_path) if is_remote(pdf_path) else pdf_path
+    # Page text comes from the parsed-text cache unless the PDF bytes changed
+    pages, labels = extract_pages(local_path)
+    documents = [
+        Document(page_content=text, metadata={"source": pdf_path, "total_pages": len(pages), "page": i, "page_label": label})
+        for i, (text, label) in enumerate(zip(pages, labels))
+    ]
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_documents(documents)
+
+    texts = [doc.page_content for doc in chunks if doc.page_content.strip()]
+    metadata = [doc.metadata for doc in chunks if doc.page_content.strip()]
+    return pdf_name, texts, metadata
+
+def plan_job(job):
+    # Returns a finished result when there is nothing to do, else None
+    if not job.texts:
+        return {"status": "error", "message": "No valid text chunks to embed."}
 
-        vectors = []
-        clean_metadata = []
+    # Only chunks whose hash differs from the manifest are embedded
+    settings = chunk_settings()
+    job.diff = ingest_manifest.diff(job.index_name, job.pdf_name, [chunk_hash(text, settings) for text in job.texts])
+    if job.diff.is_unchanged() and not job.force:
+        print(f"[Manifest] {job.pdf_name}: unchanged, skipped")
+        return {"status": "unchanged", "chunks": len(job.texts)}
+    positions = list(range(len(job.texts))) if job.force else job.diff.changed
+    if not job.force:
+        job.doc_ids = job.diff.kept_ids()
 
-        for i, item in enumerate(response.data):
-            emb = getattr(item, "embedding", None)
-            if emb and isinstance(emb, list) and len(emb) == EMBEDDING_DIM:
-                vectors.append(np.array(emb, dtype=np.float32))
-                clean_metadata.append(metadata[i] if i < len(metadata) else {})
+    # Chunks already stored (boilerplate shared with other brochures) are
+    # only recorded as another source, not embedded again
+    job.plan = chunk_registry.plan(job.index_name, job.pdf_name, job.texts, job.diff.hashes, positions, job.doc_ids)
+    if job.plan.duplicates:
+        print(f"[Dedup] {job.pdf_name}: {len(job.plan.duplicates)} of {len(positions)} chunks already stored")
+    return None
 
-        if not vectors:
-            return {"status": "error", "message": "No valid embeddings were generated."}
+def embed_job(job):
+    if not job.plan.new:
+        return None
+    batcher = EmbeddingBatcher(client, os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"))
+    embeddings, job.embedding_report = batcher.embed([job.texts[pos] for pos in job.plan.new_positions])
 
+    profile = get_embedding_profile()
+    for (pos, doc_id, _), emb in zip(job.plan.new, embeddings):
+        if emb and isinstance(emb, list) and len(emb) == EMBEDDING_DIM:
+            job.vectors.append(profile.truncate(emb))
+            job.clean_texts.append(job.texts[pos])
+            job.clean_metadata.append(job.metadata[pos] if pos < len(job.metadata) else {})
+            job.clean_ids.append(doc_id)
+
+    if not job.vectors:
+        return {"status": "error", "message": "No valid embeddings were generated."}
+    return None
+
+def upload_job(job):
+    if job.vectors:
         # create_vector_index(dim=EMBEDDING_DIM)
-        upload_documents_to_search(index_name, pdf_name, texts, vectors, clean_metadata)
+        job.upload_report = upload_documents_to_search(
+            job.index_name, job.pdf_name, job.clean_texts, job.vectors, job.clean_metadata, job.clean_ids
+        )
+        failed_ids = {doc_id for batch in job.upload_report.batches for doc_id in batch.failed_ids}
+        job.plan.keep_only(doc_id for doc_id in job.clean_ids if doc_id not in failed_ids)
+    elif job.plan.new:
+        job.plan.keep_only(())
 
-        return {"status": "embedded", "chunks": len(vectors)}
+    chunk_registry.commit(job.index_name, job.plan)
+    job.doc_ids.update((pos, doc_id) for pos, doc_id, _ in job.plan.new)
+    job.doc_ids.update((pos, doc_id) for pos, doc_id, _ in job.plan.duplicates)
+    job.deleted = remove_stale_chunks(job.index_name, job.diff, job.doc_ids)
+    # Positions that failed to embed/upload stay out of the manifest and are retried next run
+    ingest_manifest.record(job.index_name, job.pdf_name, job.pdf_path, job.diff, job.doc_ids)
+    return job.result()
+
+def process_pdf(pdf_path: str, index_name: str, force: bool = False):
+    try:
+        pdf_name, texts, metadata = parse_pdf(pdf_path)
+        job = IngestJob(pdf_path, index_name, pdf_name, texts, metadata, force)
+        return plan_job(job) or embed_job(job) or upload_job(job)
 
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
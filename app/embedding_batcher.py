@@ -0,0 +1,90 @@
+# app/embedding_batcher.py
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.tokens import count_tokens, EMBEDDING_TOKEN_ENCODING
+from app.batching import size_capped_batches, is_transient, is_payload_error, backoff_delay, BatchResult, BatchReport, RETRY_MAX_ATTEMPTS
+from dotenv import load_dotenv
+load_dotenv()
+
+# Packs chunk texts into embeddings.create calls bounded by input count and
+# total tokens, and runs the calls concurrently under a cap. Transient errors
+# are retried with backoff and re-raised once retries run out (splitting
+# would only send more requests to a throttled endpoint). A batch rejected
+# for its payload (400 / token limit) is split in half and each half
+# retried, down to single inputs, so one bad chunk costs that chunk and not
+# the brochure.
+
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "60000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+
+class EmbeddingBatcher:
+    def __init__(self, client, model, max_items=EMBEDDING_BATCH_MAX_ITEMS,
+                 max_tokens=EMBEDDING_BATCH_MAX_TOKENS, concurrency=EMBEDDING_CONCURRENCY):
+        self.client = client
+        self.model = model
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.concurrency = concurrency
+
+    def _call(self, result, texts):
+        # -> embeddings, or raises once retries are exhausted
+        while True:
+            result.attempts += 1
+            try:
+                response = self.client.embeddings.create(input=texts, model=self.model)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception as e:
+                result.errors.append(str(e))
+                if result.attempts >= RETRY_MAX_ATTEMPTS or not is_transient(e):
+                    raise
+                time.sleep(backoff_delay(result.attempts))
+
+    def _run(self, report, label, items, vectors):
+        # items: [(position, text, tokens)]; fills vectors[position]
+        result = BatchResult(label, len(items), sum(tokens for _, _, tokens in items), unit="tokens")
+        report.add(result)
+        started = time.perf_counter()
+        try:
+            embeddings = self._call(result, [text for _, text, _ in items])
+            for (pos, _, _), embedding in zip(items, embeddings):
+                vectors[pos] = embedding
+            result.succeeded = len(embeddings)
+        except Exception as e:
+            if not is_payload_error(e):
+                result.failed = len(items)
+                raise
+            if len(items) == 1:
+                result.failed = 1
+                result.failed_ids.append(items[0][0])
+            else:
+                middle = len(items) // 2
+                result.errors.append(f"split into {middle} + {len(items) - middle}")
+                self._run(report, f"{label}.0", items[:middle], vectors)
+                self._run(report, f"{label}.1", items[middle:], vectors)
+        finally:
+            result.duration_ms = (time.perf_counter() - started) * 1000
+
+    def embed(self, texts):
+        # -> (vectors aligned with texts, None where embedding failed; BatchReport)
+        vectors = [None] * len(texts)
+        report = BatchReport()
+        started = time.perf_counter()
+        items = [(pos, text, count_tokens(text, EMBEDDING_TOKEN_ENCODING)) for pos, text in enumerate(texts)]
+        batches = size_capped_batches(items, self.max_items, self.max_tokens, size=lambda item: item[2])
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [
+                pool.submit(self._run, report, str(number), batch, vectors)
+                for number, (batch, _) in enumerate(batches)
+            ]
+            for future in futures:
+                future.result()
+        report.elapsed_ms = (time.perf_counter() - started) * 1000
+        print(
+            f"[Embeddings] {report.succeeded}/{len(texts)} texts in {len(report.batches)} batches "
+            f"({report.elapsed_ms:.0f}ms)"
+        )
+        return vectors, report
@@ -0,0 +1,186 @@
+# app/embedding_cache.py
+
+import os
+import time
+import queue
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from app.ttl_cache import TTLCache
+from dotenv import load_dotenv
+load_dotenv()
+
+# Two-tier cache for query embeddings: an in-process LRU in front of a SQLite
+# file holding float32 blobs. Keys are sha256(normalized text + deployment),
+# so a repeated question or a clicked suggestion never hits the embeddings API.
+#
+# Disk writes (new vectors, last_access touches from hits) go through one
+# writer thread that commits them in batches, so set() never waits on disk
+# and the async chat path only does the disk read, in a worker thread (aget).
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/cache/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "2048"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EMBEDDING_CACHE_WRITE_BATCH = 256
+
+
+def normalize_text(text):
+    return " ".join(text.split()).casefold()
+
+
+def cache_key(text, deployment):
+    return hashlib.sha256(f"{deployment}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_PATH, memory_size=EMBEDDING_CACHE_MEMORY_SIZE, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory = TTLCache(maxsize=memory_size)
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_bytes = 0
+        self._writes = queue.Queue()
+        self._writer = None
+
+    def _db(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")  # a cache: losing the last writes is fine
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    def _disk_get(self, key):
+        with self._lock:
+            row = self._db().execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._enqueue(("touch", key, time.time()))
+
+        vector = array("f")
+        vector.frombytes(row[0])
+        vector = vector.tolist()
+        self.memory.set(key, vector)
+        return vector
+
+    def get(self, text, deployment):
+        key = cache_key(text, deployment)
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+        return self._disk_get(key)
+
+    async def aget(self, text, deployment):
+        # Memory hits stay on the loop; the SQLite read goes to a thread
+        key = cache_key(text, deployment)
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+        return await asyncio.to_thread(self._disk_get, key)
+
+    def set(self, text, deployment, vector):
+        key = cache_key(text, deployment)
+        self.memory.set(key, vector)
+        self._enqueue(("put", key, array("f", vector).tobytes(), time.time()))
+
+    def _enqueue(self, op):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="embedding-cache-writer", daemon=True)
+                    self._writer.start()
+        self._writes.put(op)
+
+    def _write_loop(self):
+        while True:
+            ops = [self._writes.get()]
+            while len(ops) < EMBEDDING_CACHE_WRITE_BATCH:
+                try:
+                    ops.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(ops)
+            except Exception as e:
+                print(f"[Embedding cache] write failed: {e}")
+            finally:
+                for _ in ops:
+                    self._writes.task_done()
+
+    def _apply(self, ops):
+        # One transaction per batch of queued writes
+        with self._lock:
+            db = self._db()
+            touches = [(op[2], op[1]) for op in ops if op[0] == "touch"]
+            db.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", touches)
+            for op in ops:
+                if op[0] != "put":
+                    continue
+                _, key, blob, at = op
+                previous = db.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+                db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", (key, blob, at)
+                )
+                self._disk_bytes += len(blob) - (previous[0] if previous else 0)
+            self._evict(db)
+            db.commit()
+
+    def flush(self):
+        # Wait until queued writes are on disk
+        self._writes.join()
+
+    def _evict(self, db):
+        # Drop least recently used rows until the file is back under budget
+        while self._disk_bytes > self.max_bytes:
+            rows = db.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            for key, size in rows:
+                db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+                if self._disk_bytes <= self.max_bytes:
+                    break
+
+    def clear(self):
+        self.memory.clear()
+        self.flush()
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM embeddings")
+            db.commit()
+            self._disk_bytes = 0
+
+    def stats(self):
+        memory = self.memory.stats()
+        lookups = memory["hits"] + self.disk_hits + self.misses
+        return {
+            "memory": memory,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.max_bytes,
+            "disk_evictions": self.disk_evictions,
+            "hit_rate": round((memory["hits"] + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,73 @@
+# app/embedding_profile.py
+
+import os
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+# How brochure and query embeddings are shaped before storage and search.
+#
+# EMBEDDING_DIMENSIONS: text-embedding-3 vectors are Matryoshka-trained, so
+#   keeping the first N dims and re-normalizing preserves most of the
+#   ranking quality (e.g. 3072 -> 1024 or 512). Must match the vector field
+#   size of the Azure index when that backend is used.
+# EMBEDDING_QUANTIZATION: storage type for the local vector index:
+#   float32, float16, or int8 (symmetric, one float32 scale per vector).
+#   int8 scores about as fast as float32 at a quarter of the memory;
+#   float16 halves memory but is several times slower to score.
+#
+# Run app/embedding_profile_benchmark.py to trade recall against size.
+
+SOURCE_EMBEDDING_DIM = 3072  # text-embedding-3-large
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(SOURCE_EMBEDDING_DIM)))
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "float32")
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+
+
+class EmbeddingProfile:
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS, quantization=EMBEDDING_QUANTIZATION):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown embedding quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        self.dimensions = dimensions
+        self.quantization = quantization
+
+    def __repr__(self):
+        return f"EmbeddingProfile({self.dimensions}d, {self.quantization})"
+
+    def bytes_per_vector(self):
+        if self.quantization == "int8":
+            return self.dimensions + 4
+        return self.dimensions * (2 if self.quantization == "float16" else 4)
+
+    def truncate(self, vectors):
+        # Works on one vector or a (n, d) batch; returns float32, unit length
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[-1] < self.dimensions:
+            raise ValueError(f"Embedding has {vectors.shape[-1]} dims, profile needs {self.dimensions}")
+        vectors = vectors[..., :self.dimensions]
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def quantize(self, matrix):
+        # (n, d) float32 -> (codes, scales); scales is None unless int8
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if self.quantization == "float32":
+            return matrix, None
+        if self.quantization == "float16":
+            return matrix.astype(np.float16), None
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def dequantize(self, codes, scales=None):
+        matrix = np.asarray(codes, dtype=np.float32)
+        if scales is not None:
+            matrix = matrix * scales[:, None]
+        return matrix
+
+
+def get_embedding_profile():
+    return EmbeddingProfile()
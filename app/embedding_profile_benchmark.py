@@ -0,0 +1,85 @@
+# app/embedding_profile_benchmark.py
+
+import os
+import sys
+import time
+import numpy as np
+from app.embedding_profile import EmbeddingProfile, QUANTIZATIONS
+from app.local_vector_index import LocalVectorIndex, read_index
+
+# Offline check of what each embedding profile costs in recall. Exact float32
+# search over the full vectors is the ground truth; every profile is scored on
+# recall@k against it, bytes per vector and query latency.
+#
+#   python -m app.embedding_profile_benchmark data/vector_store/<index>
+#   python -m app.embedding_profile_benchmark vectors.npy
+#
+# Queries are corpus rows with a little noise added, standing in for
+# paraphrased questions about a brochure chunk.
+
+BENCHMARK_DIMENSIONS = (3072, 1536, 1024, 768, 512, 256)
+BENCHMARK_QUERIES = int(os.getenv("BENCHMARK_QUERIES", "200"))
+BENCHMARK_TOP_K = int(os.getenv("BENCHMARK_TOP_K", "10"))
+BENCHMARK_NOISE = float(os.getenv("BENCHMARK_NOISE", "0.05"))
+
+
+def load_vectors(path):
+    # A saved local index directory (dequantized as stored) or a raw .npy matrix
+    if os.path.isdir(path):
+        payload, codes, scales = read_index(path)
+        return EmbeddingProfile(codes.shape[1], payload.get("quantization", "float32")).dequantize(codes, scales)
+    return np.load(path).astype(np.float32)
+
+
+def sample_queries(vectors, count, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    queries = vectors[rows] + rng.normal(0, noise, size=(len(rows), vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def build_index(vectors, profile):
+    index = LocalVectorIndex(os.devnull, profile=profile)
+    index.upsert([{"id": str(i), "embedding": v} for i, v in enumerate(vectors)])
+    return index
+
+
+def run_benchmark(vectors, queries, top_k=BENCHMARK_TOP_K, dimensions=BENCHMARK_DIMENSIONS):
+    full = EmbeddingProfile(vectors.shape[1], "float32")
+    truth = [{hit["id"] for hit in hits} for hits in build_index(vectors, full).search_batch(queries, top_k)]
+
+    results = []
+    for dims in dimensions:
+        if dims > vectors.shape[1]:
+            continue
+        for quantization in QUANTIZATIONS:
+            profile = EmbeddingProfile(dims, quantization)
+            index = build_index(vectors, profile)
+            t0 = time.perf_counter()
+            found = [index.search(query, top_k) for query in queries]
+            latency_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            recall = np.mean([len(truth[i] & {hit["id"] for hit in hits}) / len(truth[i]) for i, hits in enumerate(found)])
+            results.append({
+                "dimensions": dims,
+                "quantization": quantization,
+                "bytes_per_vector": profile.bytes_per_vector(),
+                "index_mb": round(index.nbytes / 1024 / 1024, 2),
+                f"recall@{top_k}": round(float(recall), 4),
+                "query_ms": round(latency_ms, 3),
+            })
+    return results
+
+
+def main(path):
+    vectors = load_vectors(path)
+    queries = sample_queries(vectors, BENCHMARK_QUERIES, BENCHMARK_NOISE)
+    print(f"[Benchmark] {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries")
+    for row in run_benchmark(vectors, queries):
+        print("  " + "  ".join(f"{key}={value}" for key, value in row.items()))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python -m app.embedding_profile_benchmark <local index dir | vectors.npy>")
+        sys.exit(1)
+    main(sys.argv[1])
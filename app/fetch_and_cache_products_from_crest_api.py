@@ -2,6 +2,8 @@ import os
 import json
 import httpx
 from fastapi.responses import JSONResponse
+from app.catalog_snapshot import write_snapshot, snapshot_path_for
+from app.answer_cache import answer_cache
 
 async def fetch_and_cache_products_from_crest_api():
     timeout = httpx.Timeout(30.0)
@@ -25,15 +27,23 @@ async def fetch_and_cache_products_from_crest_api():
             hard_data = hard_res.json()
             combined_data = soft_data + hard_data
 
-            # Save to files
-            with open(os.path.join(OUTPUT_DIR, "cached_soft_surface_products.json"), "w") as sf:
-                json.dump(soft_data, sf, indent=2)
-
-            with open(os.path.join(OUTPUT_DIR, "cached_hard_surface_products.json"), "w") as hf:
-                json.dump(hard_data, hf, indent=2)
-
-            with open(os.path.join(OUTPUT_DIR, "cached_all_products.json"), "w") as af:
-                json.dump(combined_data, af, indent=2)
+            # Save to files, each with a memory-mappable snapshot next to it
+            for file_name, data in (
+                ("cached_soft_surface_products.json", soft_data),
+                ("cached_hard_surface_products.json", hard_data),
+                ("cached_all_products.json", combined_data),
+            ):
+                json_path = os.path.join(OUTPUT_DIR, file_name)
+                with open(json_path, "w") as f:
+                    json.dump(data, f, indent=2)
+                try:
+                    write_snapshot(data, snapshot_path_for(json_path))
+                except ValueError as e:
+                    # The store falls back to the (newer) JSON file
+                    print(f"[Catalog snapshot] {file_name}: {e}")
+
+            # Answers quote product URLs and images from the old cache
+            answer_cache.invalidate()
 
             return JSONResponse(content={
                 "message": "Products fetched and cached successfully.",
@@ -0,0 +1,32 @@
+# app/filter_cache.py
+
+import os
+from app.ttl_cache import TTLCache
+from app.catalog_store import get_catalog
+from app.embedding_cache import normalize_text
+from dotenv import load_dotenv
+load_dotenv()
+
+# Memoized structured-filter extraction. The extracted filters depend only on
+# the query, the index and the known collection/style names, so the key
+# carries the catalog's vocabulary hash: a Crest refresh that changes those
+# names makes every older entry unreachable.
+
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "4096"))
+FILTER_CACHE_TTL = float(os.getenv("FILTER_CACHE_TTL", "3600"))
+
+filter_cache = TTLCache(maxsize=FILTER_CACHE_SIZE, ttl=FILTER_CACHE_TTL)
+
+
+def filter_cache_key(user_query, index_name):
+    return (index_name, get_catalog(index_name).vocabulary_hash, normalize_text(user_query))
+
+
+def get_cached_filters(user_query, index_name):
+    filters = filter_cache.get(filter_cache_key(user_query, index_name))
+    # Callers add DB-only keys to the dict they get back
+    return dict(filters) if filters is not None else None
+
+
+def set_cached_filters(user_query, index_name, filters):
+    filter_cache.set(filter_cache_key(user_query, index_name), dict(filters))
@@ -0,0 +1,182 @@
+# app/filter_extractor.py
+
+import os
+import re
+import threading
+from collections import deque
+from app.catalog_store import get_catalog
+from dotenv import load_dotenv
+load_dotenv()
+
+# Deterministic filter extraction from catalog vocabulary. An Aho-Corasick
+# automaton over every collection, style, color, product type and
+# construction name finds all catalog terms in the query in one pass. The
+# result has the same shape as extract_structured_filters' output plus a
+# confidence score; callers only fall back to GPT when confidence is low.
+
+LOCAL_FILTER_MIN_CONFIDENCE = float(os.getenv("LOCAL_FILTER_MIN_CONFIDENCE", "0.75"))
+
+# Catalog field -> filter field, in priority order. When one name appears
+# under several fields (e.g. a collection and a style of the same name) the
+# earlier field wins, matching parse_filters' style -> collection rule.
+VOCABULARY_FIELDS = [
+    ("collectionName", "collection_name"),
+    ("styleName", "style_name"),
+    ("producttype", "producttype"),
+    ("constructiontype", "construction"),
+    ("sku_color", "marketing_color_name"),
+]
+FIELD_PRIORITY = {field: i for i, (_, field) in enumerate(VOCABULARY_FIELDS)}
+
+# How much a matched term vouches for the tokens it covers. Single-word color
+# names ("Aim", "Balanced", "Metal") are often ordinary words.
+FIELD_WEIGHT = {
+    "collection_name": 1.0,
+    "style_name": 1.0,
+    "producttype": 0.9,
+    "construction": 0.9,
+    "marketing_color_name": 0.9,
+}
+SINGLE_WORD_COLOR_WEIGHT = 0.5
+
+MIN_TERM_LENGTH = 3
+
+# Words that carry no filter information and don't count against coverage
+STOPWORDS = frozenset("""
+a about all an and any are available best can collection collections color colors colour
+do does details find floor flooring floors for from give good have i in info information
+is it like list looking me more my need of on option options or our please product products
+show similar some style styles tell that the these this those to want we what which with you your
+""".split())
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:\.[0-9]+)?")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def normalize_term(text):
+    return " ".join(tokenize(text))
+
+
+class AhoCorasick:
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern, payload):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), payload))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def iter_matches(self, text):
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, payload in self._out[node]:
+                yield i + 1 - length, i + 1, payload
+
+
+def build_automaton(catalog):
+    terms = {}  # normalized term -> (filter field, canonical value)
+    for catalog_field, filter_field in VOCABULARY_FIELDS:
+        for value in catalog.distinct(catalog_field):
+            term = normalize_term(value)
+            if len(term) < MIN_TERM_LENGTH:
+                continue
+            current = terms.get(term)
+            if current is None or FIELD_PRIORITY[filter_field] < FIELD_PRIORITY[current[0]]:
+                terms[term] = (filter_field, value)
+
+    automaton = AhoCorasick()
+    for term, (field, value) in terms.items():
+        automaton.add(term, (field, value))
+    return automaton.build()
+
+
+_automata = {}  # index_name -> (catalog version, automaton)
+_automata_lock = threading.Lock()
+
+
+def get_automaton(index_name):
+    catalog = get_catalog(index_name)
+    cached = _automata.get(index_name)
+    if cached and cached[0] == catalog.version:
+        return cached[1]
+    with _automata_lock:
+        cached = _automata.get(index_name)
+        if cached and cached[0] == catalog.version:
+            return cached[1]
+        automaton = build_automaton(catalog)
+        _automata[index_name] = (catalog.version, automaton)
+        return automaton
+
+
+def extract_local_filters(user_query, index_name):
+    text = normalize_term(user_query)
+    if not text:
+        return {}, 0.0
+
+    # Keep whole-word matches only
+    matches = [
+        (start, end, field, value)
+        for start, end, (field, value) in get_automaton(index_name).iter_matches(text)
+        if (start == 0 or text[start - 1] == " ") and (end == len(text) or text[end] == " ")
+    ]
+
+    # Longest terms first, then field priority; one value per field
+    matches.sort(key=lambda m: (-(m[1] - m[0]), FIELD_PRIORITY[m[2]], m[0]))
+    filters, taken, spans = {}, [False] * len(text), []
+    for start, end, field, value in matches:
+        if field in filters or any(taken[start:end]):
+            continue
+        filters[field] = value
+        spans.append((start, end, field))
+        for i in range(start, end):
+            taken[i] = True
+
+    # Confidence: share of meaningful query tokens explained by matched terms
+    weights, pos = [], 0
+    for token in text.split(" "):
+        start, end = pos, pos + len(token)
+        pos = end + 1
+        if token in STOPWORDS:
+            continue
+        weight = 0.0
+        for span_start, span_end, field in spans:
+            if span_start <= start and end <= span_end:
+                single_word = " " not in text[span_start:span_end]
+                if field == "marketing_color_name" and single_word:
+                    weight = SINGLE_WORD_COLOR_WEIGHT
+                else:
+                    weight = FIELD_WEIGHT[field]
+                break
+        weights.append(weight)
+
+    confidence = sum(weights) / len(weights) if weights else 0.0
+    return filters, round(confidence, 3)
@@ -0,0 +1,94 @@
+# app/hybrid_search.py
+
+import os
+import re
+import math
+from collections import Counter
+from dotenv import load_dotenv
+load_dotenv()
+
+# Lexical side of hybrid retrieval plus rank fusion. Vector search alone is
+# weak on SKU codes, style numbers and exact collection names; fusing it
+# with a BM25 ranking through weighted reciprocal rank fusion keeps those
+# chunks near the top without raising k.
+#
+# Azure Search fuses the two rankings itself in a single hybrid query (the
+# weights reach it as the vector query's weight); the BM25 index and
+# fuse_hits here serve the local vector store.
+
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")  # "hybrid" or "vector"
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Codes like "1836-120" or "2.5" stay whole, and their parts are indexed too
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[-./][0-9a-z]+)*")
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN_RE.findall(text.casefold()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(t for t in re.split(r"[-./]", token) if t)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings, weights=None, k=RRF_K):
+    # rankings: {name: [doc id, best first]} -> [(doc id, fused score)], best first
+    weights = weights or {}
+    scores = {}
+    for name, ranking in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def fuse_hits(vector_hits, keyword_hits, top_k,
+              vector_weight=HYBRID_VECTOR_WEIGHT, keyword_weight=HYBRID_KEYWORD_WEIGHT):
+    # Hits are dicts with at least "id"; returns the top_k fused hits
+    by_id = {hit["id"]: hit for hit in keyword_hits}
+    by_id.update({hit["id"]: hit for hit in vector_hits})
+    fused = reciprocal_rank_fusion(
+        {
+            "vector": [hit["id"] for hit in vector_hits],
+            "keyword": [hit["id"] for hit in keyword_hits],
+        },
+        weights={"vector": vector_weight, "keyword": keyword_weight},
+    )
+    return [by_id[doc_id] for doc_id, _ in fused[:top_k]]
+
+
+class BM25Index:
+    def __init__(self, ids, texts, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> [(doc position, term frequency)]
+        self.lengths = []
+        for pos, text in enumerate(texts):
+            counts = Counter(tokenize(text or ""))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((pos, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        n = len(self.ids)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=10):
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for pos, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[pos] / (self.avg_length or 1))
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.ids[pos], score) for pos, score in ranked]
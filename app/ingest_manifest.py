@@ -0,0 +1,157 @@
+# app/ingest_manifest.py
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+
+# What was last ingested for every brochure: one content hash per chunk
+# position plus the doc id that position is served by (its own chunk, or the
+# stored copy it was deduplicated against), and a brochure hash over all of
+# them. process_pdf compares a fresh parse against it to embed only chunks
+# whose content is new and to delete ids the brochure no longer produces.
+#
+# The chunk hash covers everything that changes the stored vector: text,
+# splitter settings, embedding deployment and embedding profile.
+
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "data/cache/ingest_manifest.sqlite3")
+
+
+def chunk_hash(text, settings):
+    return hashlib.sha256(f"{settings}\0{text}".encode("utf-8")).hexdigest()
+
+
+def chunk_doc_id(pdf_name, content_hash):
+    # Content-addressed: an id never holds different text, so other brochures
+    # can keep pointing at it after this one is edited
+    return f"{pdf_name}-{content_hash[:24]}"
+
+
+def brochure_hash(chunk_hashes):
+    return hashlib.sha256("\n".join(chunk_hashes).encode("utf-8")).hexdigest()
+
+
+class ChunkDiff:
+    def __init__(self, pdf_name, hashes, previous):
+        # previous: {position: (doc id, content hash)}. Matched by content, not
+        # position: a chunk that only moved (text inserted before it) keeps
+        # its stored vector and id
+        self.pdf_name = pdf_name
+        self.hashes = hashes
+        self.previous = previous
+        self.stored = {h: doc_id for doc_id, h in previous.values()}
+        self.unchanged = [pos for pos, h in enumerate(hashes) if h in self.stored]
+        self.changed = [pos for pos, h in enumerate(hashes) if h not in self.stored]
+
+    @property
+    def brochure_hash(self):
+        return brochure_hash(self.hashes)
+
+    def is_unchanged(self):
+        # Same chunks in the same order: nothing to embed or re-record
+        return len(self.previous) == len(self.hashes) and all(
+            self.previous.get(pos, (None, None))[1] == h for pos, h in enumerate(self.hashes)
+        )
+
+    def kept_ids(self):
+        # {position: stored doc id} for the unchanged chunks
+        return {pos: self.stored[self.hashes[pos]] for pos in self.unchanged}
+
+    def previous_ids(self):
+        return {doc_id for doc_id, _ in self.previous.values()}
+
+
+class IngestManifest:
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS brochures ("
+                "index_name TEXT NOT NULL, pdf_name TEXT NOT NULL, source TEXT, brochure_hash TEXT NOT NULL, "
+                "chunks INTEGER NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (index_name, pdf_name))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS bulk_progress ("
+                "run_key TEXT NOT NULL, url TEXT NOT NULL, status TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (run_key, url))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "index_name TEXT NOT NULL, pdf_name TEXT NOT NULL, position INTEGER NOT NULL, "
+                "doc_id TEXT NOT NULL, content_hash TEXT NOT NULL, PRIMARY KEY (index_name, pdf_name, position))"
+            )
+        return self._conn
+
+    def diff(self, index_name, pdf_name, hashes):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT position, doc_id, content_hash FROM chunks WHERE index_name = ? AND pdf_name = ?",
+                (index_name, pdf_name),
+            ).fetchall()
+        return ChunkDiff(pdf_name, hashes, {pos: (doc_id, h) for pos, doc_id, h in rows})
+
+    def record(self, index_name, pdf_name, source, diff, doc_ids):
+        # doc_ids: {position: doc id} for every position that is now stored
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM chunks WHERE index_name = ? AND pdf_name = ?", (index_name, pdf_name))
+            db.executemany(
+                "INSERT INTO chunks (index_name, pdf_name, position, doc_id, content_hash) VALUES (?, ?, ?, ?, ?)",
+                [(index_name, pdf_name, pos, doc_id, diff.hashes[pos]) for pos, doc_id in sorted(doc_ids.items())],
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO brochures (index_name, pdf_name, source, brochure_hash, chunks, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (index_name, pdf_name, source, diff.brochure_hash, len(doc_ids), time.time()),
+            )
+            db.commit()
+
+    def brochures(self, index_name):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT pdf_name, source, brochure_hash, chunks, updated_at FROM brochures WHERE index_name = ? "
+                "ORDER BY pdf_name",
+                (index_name,),
+            ).fetchall()
+        return [
+            {"pdf_name": name, "source": source, "hash": h, "chunks": chunks, "updated_at": updated_at}
+            for name, source, h, chunks, updated_at in rows
+        ]
+
+    # Bulk runs: which brochures of a run finished cleanly, so a job that
+    # died half way resumes where it stopped
+    def bulk_done(self, run_key):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT url FROM bulk_progress WHERE run_key = ? AND status = 'done'", (run_key,)
+            ).fetchall()
+        return {url for (url,) in rows}
+
+    def mark_bulk(self, run_key, url, status):
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO bulk_progress (run_key, url, status, updated_at) VALUES (?, ?, ?, ?)",
+                (run_key, url, status, time.time()),
+            )
+            db.commit()
+
+    def clear_bulk(self, run_key):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM bulk_progress WHERE run_key = ?", (run_key,))
+            db.commit()
+
+
+ingest_manifest = IngestManifest()
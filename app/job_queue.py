@@ -0,0 +1,316 @@
+# app/job_queue.py
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+import traceback
+from dotenv import load_dotenv
+load_dotenv()
+
+# Durable background jobs for brochure ingestion. /embed/ and /bulk-embed/
+# enqueue a job and return its id; a small pool of threads in the job worker
+# process (app/job_worker.py, not the API process) runs the jobs. Job state
+# and per-brochure progress live in SQLite, so status survives a restart.
+#
+# Several worker processes can share the queue. A job is claimed with a
+# conditional UPDATE, so only one worker gets it, and the claiming worker
+# holds a lease it renews every JOB_LEASE_SECONDS / 3. A job whose lease ran
+# out (its process died) is queued again and picked up by any worker; the
+# bulk pipeline then resumes where it stopped.
+#
+# Cancellation is cooperative: handlers check JobContext.cancelled() between
+# brochures and stop taking new work.
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "data/cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_STOP_TIMEOUT = float(os.getenv("JOB_STOP_TIMEOUT", "10"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    # Handed to a job handler for progress reporting and cancel checks
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    def start(self, items):
+        self.queue._set_items(self.job_id, items)
+
+    def update(self, item, status, result=None):
+        self.queue._update_item(self.job_id, item, status, result)
+
+    def cancelled(self):
+        return self.queue._cancel_requested(self.job_id)
+
+
+class JobQueue:
+    def __init__(self, path=JOB_QUEUE_PATH, workers=JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.handlers = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._conn = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _db(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+                "result TEXT, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, owner TEXT, lease_until REAL)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            for column in ("owner TEXT", "lease_until REAL"):
+                if column.split()[0] not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            self._conn.commit()
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                "job_id TEXT NOT NULL, item TEXT NOT NULL, status TEXT NOT NULL, result TEXT, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (job_id, item))"
+            )
+        return self._conn
+
+    def register(self, kind, handler):
+        # handler(payload dict, JobContext) -> JSON-serializable result
+        self.handlers[kind] = handler
+
+    # === API side ===
+    def enqueue(self, kind, payload):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, time.time()),
+            )
+            db.commit()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id, with_items=True):
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT id, kind, payload, status, result, error, cancel_requested, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            items = db.execute(
+                "SELECT item, status, result, updated_at FROM job_items WHERE job_id = ? ORDER BY rowid", (job_id,)
+            ).fetchall() if with_items else []
+        job = self._job_dict(row)
+        counts = {}
+        for _, status, _, _ in items:
+            counts[status] = counts.get(status, 0) + 1
+        job["progress"] = {"total": len(items), **counts}
+        if with_items:
+            job["items"] = [
+                {"item": item, "status": status, "result": json.loads(result) if result else None, "updated_at": updated}
+                for item, status, result, updated in items
+            ]
+        return job
+
+    def list(self, limit=50):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, kind, payload, status, result, error, cancel_requested, created_at, started_at, finished_at "
+                "FROM jobs ORDER BY created_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        jobs = [self._job_dict(row) for row in rows]
+        for job in jobs:
+            job.pop("result")
+        return jobs
+
+    def cancel(self, job_id):
+        # Queued jobs are cancelled at once; running ones at their next check
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            # Conditional updates: a worker in another process may claim the
+            # job in between
+            cancelled = db.execute(
+                "UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            ).rowcount
+            if not cancelled:
+                db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+            db.commit()
+        return self.get(job_id, with_items=False)
+
+    @staticmethod
+    def _job_dict(row):
+        job_id, kind, payload, status, result, error, cancel_requested, created, started, finished = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "payload": json.loads(payload),
+            "status": status,
+            "cancel_requested": bool(cancel_requested),
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created,
+            "started_at": started,
+            "finished_at": finished,
+        }
+
+    # === Worker side ===
+    def _set_items(self, job_id, items):
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT OR IGNORE INTO job_items (job_id, item, status, updated_at) VALUES (?, ?, ?, ?)",
+                [(job_id, item, QUEUED, time.time()) for item in items],
+            )
+            db.commit()
+
+    def _update_item(self, job_id, item, status, result=None):
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO job_items (job_id, item, status, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, item, status, json.dumps(result) if result is not None else None, time.time()),
+            )
+            db.commit()
+
+    def _cancel_requested(self, job_id):
+        with self._lock:
+            row = self._db().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _claim(self):
+        with self._lock:
+            db = self._db()
+            now = time.time()
+            # Jobs whose worker stopped renewing its lease go back to the queue
+            expired = db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, started_at = NULL "
+                "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, now),
+            ).rowcount
+            if expired:
+                print(f"[Jobs] requeued {expired} job(s) with an expired lease")
+            db.commit()
+            while True:
+                row = db.execute(
+                    "SELECT id, kind, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                # Only one worker (in any process) wins the row
+                claimed = db.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, started_at = ? WHERE id = ? AND status = ?",
+                    (RUNNING, self.worker_id, now + JOB_LEASE_SECONDS, now, row[0], QUEUED),
+                ).rowcount
+                db.commit()
+                if claimed:
+                    return row[0], row[1], json.loads(row[2])
+
+    def _renew_leases(self):
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?",
+                (time.time() + JOB_LEASE_SECONDS, self.worker_id, RUNNING),
+            )
+            db.commit()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        # Ignored if the lease was lost and the job now belongs to another worker
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND owner = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, self.worker_id),
+            )
+            db.commit()
+
+    def _run(self, job_id, kind, payload):
+        context = JobContext(self, job_id)
+        print(f"[Jobs] {kind} {job_id} started")
+        try:
+            result = self.handlers[kind](payload, context)
+        except JobCancelled:
+            self._finish(job_id, CANCELLED)
+        except Exception as e:
+            print(traceback.format_exc())
+            self._finish(job_id, FAILED, error=str(e))
+        else:
+            if context.cancelled():
+                status = CANCELLED
+            elif isinstance(result, dict) and result.get("status") == "error":
+                status = FAILED
+            else:
+                status = SUCCEEDED
+            self._finish(job_id, status, result=result, error=result.get("message") if status == FAILED else None)
+        print(f"[Jobs] {kind} {job_id} finished")
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            claimed = self._claim()
+            if claimed is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(*claimed)
+
+    def _heartbeat(self):
+        while not self._stopping.wait(JOB_LEASE_SECONDS / 3):
+            self._renew_leases()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=JOB_STOP_TIMEOUT):
+        # Waits up to timeout for running jobs; one still running after that
+        # keeps no lease once the process exits and is requeued elsewhere
+        self._stopping.set()
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        still_running = [thread.name for thread in self._threads if thread.is_alive()]
+        if still_running:
+            print(f"[Jobs] stopped with {len(still_running)} thread(s) still busy: {still_running}")
+        self._threads = []
+
+
+job_queue = JobQueue()
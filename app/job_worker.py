@@ -0,0 +1,77 @@
+# app/job_worker.py
+
+import os
+import signal
+import threading
+import multiprocessing
+from app.embedding import process_pdf
+from app.bulk_embed import process_bulk_embedding
+from app.job_queue import job_queue, JOB_STOP_TIMEOUT
+from app.pdf_extract import shutdown_pool
+from dotenv import load_dotenv
+load_dotenv()
+
+# Process that runs the job queue's workers, so ingestion (MinHash,
+# tokenizing, serializing uploads, in-process PDF parsing) never holds the
+# GIL the API's event loop needs. By default the API spawns one on startup
+# and stops it on shutdown; with JOB_WORKER_PROCESS=0 the API only enqueues
+# and workers are run separately with
+#
+#   python -m app.job_worker
+#
+# Any number of worker processes can share the queue (see app/job_queue.py).
+
+JOB_WORKER_PROCESS = os.getenv("JOB_WORKER_PROCESS", "1") == "1"
+
+
+def run_embed_job(payload, job):
+    job.start([payload["file_path"]])
+    result = process_pdf(payload["file_path"], payload["index_name"], payload["force"])
+    job.update(payload["file_path"], result.get("status"), result)
+    return result
+
+
+def run_bulk_embed_job(payload, job):
+    return process_bulk_embedding(payload["excel_url"], payload["index_name"], payload["force"], job)
+
+
+def register_handlers(queue):
+    # The API registers them too: the registry is also the list of job kinds enqueue accepts
+    queue.register("embed", run_embed_job)
+    queue.register("bulk_embed", run_bulk_embed_job)
+
+
+def run():
+    # Runs until SIGTERM / SIGINT, then lets running jobs finish for up to JOB_STOP_TIMEOUT
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    register_handlers(job_queue)
+    job_queue.start()
+    print(f"[Jobs] worker process {os.getpid()} started ({job_queue.workers} workers)")
+    while not stopping.wait(1):
+        pass
+    job_queue.stop()
+    shutdown_pool()
+    print(f"[Jobs] worker process {os.getpid()} stopped")
+
+
+def start_process():
+    # Spawned, not forked: the API process has an event loop and threads.
+    # Not a daemon: the bulk pipeline starts its own process pools.
+    process = multiprocessing.get_context("spawn").Process(target=run, name="job-worker")
+    process.start()
+    return process
+
+
+def stop_process(process, timeout=JOB_STOP_TIMEOUT + 5):
+    process.terminate()
+    process.join(timeout)
+    if process.is_alive():
+        print(f"[Jobs] worker process {process.pid} did not stop in {timeout}s; killing it")
+        process.kill()
+        process.join()
+
+
+if __name__ == "__main__":
+    run()
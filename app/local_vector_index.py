@@ -0,0 +1,294 @@
+# app/local_vector_index.py
+
+import os
+import json
+import uuid
+import heapq
+import threading
+import numpy as np
+from app.hybrid_search import BM25Index
+from app.embedding_profile import EmbeddingProfile, get_embedding_profile
+
+# In-process vector index for one search index: a matrix of L2-normalized
+# embeddings (so dot product == cosine similarity) with exact top-k by
+# matrix-vector product, plus an optional HNSW-style navigable graph (single
+# layer, greedy beam search) for approximate search.
+#
+# Rows are kept in the embedding profile's storage type (float32, float16,
+# or int8 + one scale per row) and dequantized block by block while scoring,
+# so the full float32 matrix never has to sit in memory. Blocks are small
+# enough to stay in CPU cache between the cast and the matmul, which keeps
+# int8 scoring about as fast as float32. numpy has no fast float16 -> float32
+# cast, so float16 costs several times float32's query latency: it only
+# saves memory. float32 stays the default profile.
+#
+# Persisted as <dir>/documents.json naming a <dir>/vectors-<generation>.npz
+# (codes + scales). A save writes the new vectors file, then swaps
+# documents.json in with os.replace, then removes the old vectors file, so
+# a crash at any point leaves a matching pair on disk.
+
+SCORE_BLOCK_BYTES = 1024 * 1024
+
+
+def read_index(path):
+    # -> (documents.json payload, codes, scales) of a saved index, or None
+    docs_path = os.path.join(path, "documents.json")
+    if not os.path.exists(docs_path):
+        return None
+    with open(docs_path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    if "vectors" in payload:
+        with np.load(os.path.join(path, payload["vectors"])) as arrays:
+            codes = arrays["codes"]
+            scales = arrays["scales"] if "scales" in arrays.files else None
+        return payload, codes, scales
+    # Layout before generations: vectors.npy (+ scales.npy)
+    vectors_path = os.path.join(path, "vectors.npy")
+    scales_path = os.path.join(path, "scales.npy")
+    if not os.path.exists(vectors_path):
+        return None
+    return payload, np.load(vectors_path), np.load(scales_path) if os.path.exists(scales_path) else None
+
+
+class NeighborGraph:
+    # rows(indices) returns the float32 vectors stored at those rows
+    def __init__(self, rows, count, m=16, ef_construction=64):
+        self.rows = rows
+        self.m = m
+        self.ef_construction = ef_construction
+        self.neighbors = []
+        self.entry = 0
+        for row in range(count):
+            self.insert(row)
+
+    def insert(self, row):
+        if row == 0:
+            self.neighbors.append([])
+            return
+        candidates = self.search(self.rows([row])[0], self.ef_construction)
+        self.neighbors.append([r for _, r in candidates[:self.m]])
+        for _, other in candidates[:self.m]:
+            links = self.neighbors[other]
+            links.append(row)
+            if len(links) > 2 * self.m:
+                # Keep the closest links of an over-full node
+                scores = self.rows(links) @ self.rows([other])[0]
+                keep = np.argsort(-scores)[:2 * self.m]
+                self.neighbors[other] = [links[i] for i in keep]
+
+    def search(self, query, ef):
+        # Best-first search from the entry point; returns [(score, row)] by score desc
+        start = self.entry
+        visited = {start}
+        score = float(self.rows([start])[0] @ query)
+        frontier = [(-score, start)]
+        best = [(score, start)]  # min-heap of the ef best found so far
+        while frontier:
+            neg, row = heapq.heappop(frontier)
+            if len(best) >= ef and -neg < best[0][0]:
+                break
+            unseen = [n for n in self.neighbors[row] if n not in visited]
+            if not unseen:
+                continue
+            visited.update(unseen)
+            scores = self.rows(unseen) @ query
+            for n, s in zip(unseen, scores.tolist()):
+                if len(best) < ef or s > best[0][0]:
+                    heapq.heappush(frontier, (-s, n))
+                    heapq.heappush(best, (s, n))
+                    if len(best) > ef:
+                        heapq.heappop(best)
+        return sorted(best, reverse=True)
+
+
+class LocalVectorIndex:
+    def __init__(self, path, ann=False, profile=None):
+        self.path = path
+        self.ann = ann
+        self.profile = profile or get_embedding_profile()
+        self._lock = threading.RLock()
+        self.ids = []
+        self.id_to_row = {}
+        self.documents = []  # every non-vector field, per row
+        self.codes, self.scales = self.profile.quantize(np.zeros((0, self.profile.dimensions), dtype=np.float32))
+        self._graph = None
+        self._bm25 = None
+        self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _load(self):
+        stored = read_index(self.path)
+        if stored is None:
+            return
+        payload, codes, scales = stored
+        self.ids = payload["ids"]
+        self.documents = payload["documents"]
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+        stored = EmbeddingProfile(codes.shape[1], payload.get("quantization", "float32"))
+        if stored.dimensions < self.profile.dimensions:
+            raise ValueError(
+                f"Local vector index {self.path} holds {stored.dimensions}-dim vectors but EMBEDDING_DIMENSIONS "
+                f"is {self.profile.dimensions}; lower EMBEDDING_DIMENSIONS or re-embed into a new index"
+            )
+        if (stored.dimensions, stored.quantization) != (self.profile.dimensions, self.profile.quantization):
+            # Written under another profile: re-encode once instead of re-embedding
+            print(f"[LocalVectorIndex] Re-encoding {self.path} from {stored} to {self.profile}")
+            codes, scales = self.profile.quantize(self.profile.truncate(stored.dequantize(codes, scales)))
+        self.codes, self.scales = codes, scales
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            docs_path = os.path.join(self.path, "documents.json")
+            vectors_file = f"vectors-{uuid.uuid4().hex[:12]}.npz"
+            vectors_path = os.path.join(self.path, vectors_file)
+            arrays = {"codes": self.codes} if self.scales is None else {"codes": self.codes, "scales": self.scales}
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(vectors_path + ".tmp", vectors_path)
+            with open(docs_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "ids": self.ids, "documents": self.documents,
+                    "quantization": self.profile.quantization, "vectors": vectors_file,
+                }, f)
+            os.replace(docs_path + ".tmp", docs_path)
+            # documents.json now points at the new generation; older files are unreferenced
+            for name in os.listdir(self.path):
+                if name != vectors_file and (name.startswith("vectors") or name == "scales.npy"):
+                    os.remove(os.path.join(self.path, name))
+
+    def rows(self, indices):
+        scales = self.scales[indices] if self.scales is not None else None
+        return self.profile.dequantize(self.codes[indices], scales)
+
+    def upsert(self, documents):
+        if not documents:
+            return 0
+        incoming = self.profile.truncate([doc["embedding"] for doc in documents])
+        with self._lock:
+            appended = []
+            replaced = {}
+            for doc, vector in zip(documents, incoming):
+                fields = {k: v for k, v in doc.items() if k not in ("id", "embedding")}
+                row = self.id_to_row.get(doc["id"])
+                if row is None:
+                    self.id_to_row[doc["id"]] = len(self.ids) + len(appended)
+                    appended.append((doc["id"], fields, vector))
+                elif row >= len(self.ids):
+                    # Same id twice in one batch: last one wins
+                    appended[row - len(self.ids)] = (doc["id"], fields, vector)
+                else:
+                    self.documents[row] = fields
+                    replaced[row] = vector
+            self._bm25 = None
+
+            if replaced:
+                rows = list(replaced)
+                codes, scales = self.profile.quantize(np.stack([replaced[r] for r in rows]))
+                self.codes[rows] = codes
+                if scales is not None:
+                    self.scales[rows] = scales
+                self._graph = None  # moved vectors invalidate graph links
+
+            if appended:
+                start = len(self.ids)
+                codes, scales = self.profile.quantize(np.stack([v for _, _, v in appended]))
+                self.ids.extend(doc_id for doc_id, _, _ in appended)
+                self.documents.extend(fields for _, fields, _ in appended)
+                self.codes = np.concatenate([self.codes, codes])
+                if scales is not None:
+                    self.scales = np.concatenate([self.scales, scales])
+                if self._graph is not None:
+                    for row in range(start, len(self.ids)):
+                        self._graph.insert(row)
+            return len(documents)
+
+    def delete(self, ids):
+        with self._lock:
+            doomed = set(ids)
+            keep = [row for row, doc_id in enumerate(self.ids) if doc_id not in doomed]
+            if len(keep) == len(self.ids):
+                return 0
+            removed = len(self.ids) - len(keep)
+            self.ids = [self.ids[row] for row in keep]
+            self.documents = [self.documents[row] for row in keep]
+            self.codes = self.codes[keep]
+            if self.scales is not None:
+                self.scales = self.scales[keep]
+            self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            self._graph = None
+            self._bm25 = None
+            return removed
+
+    def get(self, doc_id):
+        row = self.id_to_row.get(doc_id)
+        if row is None:
+            return None
+        return {"id": doc_id, **self.documents[row]}
+
+    def _hits(self, rows, scores):
+        return [{"id": self.ids[r], "score": float(s), **self.documents[r]} for r, s in zip(rows, scores)]
+
+    def score(self, queries):
+        # (q, d) unit queries -> (q, n) cosine scores; int8 scales are applied
+        # to the scores instead of the rows, so each block is a single cast
+        # into a reused, cache-sized float32 buffer
+        if self.codes.dtype == np.float32:
+            return queries @ self.codes.T
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        block_rows = max(16, SCORE_BLOCK_BYTES // (4 * self.codes.shape[1]))
+        buffer = np.empty((block_rows, self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.ids), block_rows):
+            stop = min(start + block_rows, len(self.ids))
+            rows = buffer[:stop - start]
+            np.copyto(rows, self.codes[start:stop], casting="unsafe")
+            block = queries @ rows.T
+            if self.scales is not None:
+                block *= self.scales[start:stop]
+            scores[:, start:stop] = block
+        return scores
+
+    def search(self, vector, top_k=10):
+        return self.search_batch([vector], top_k)[0]
+
+    def search_batch(self, vectors, top_k=10):
+        # Exact cosine top-k for several queries with one pass over the rows
+        with self._lock:
+            if not len(self.ids):
+                return [[] for _ in vectors]
+            scores = self.score(self.profile.truncate(vectors))
+            k = min(top_k, len(self.ids))
+            results = []
+            for row_scores in scores:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                top = top[np.argsort(-row_scores[top])]
+                results.append(self._hits(top, row_scores[top]))
+            return results
+
+    def ann_search(self, vector, top_k=10, ef=64):
+        with self._lock:
+            if not len(self.ids):
+                return []
+            if self._graph is None:
+                self._graph = NeighborGraph(self.rows, len(self.ids))
+            query = self.profile.truncate(vector)
+            found = self._graph.search(query, max(ef, top_k))[:top_k]
+            return self._hits([r for _, r in found], [s for s, _ in found])
+
+    def keyword_search(self, text, top_k=10):
+        with self._lock:
+            if self._bm25 is None:
+                self._bm25 = BM25Index(self.ids, (doc.get("content", "") for doc in self.documents))
+            ranked = self._bm25.search(text, top_k)
+            rows = [self.id_to_row[doc_id] for doc_id, _ in ranked]
+            return self._hits(rows, [score for _, score in ranked])
+
+    def query(self, vector, top_k=10):
+        return self.ann_search(vector, top_k) if self.ann else self.search(vector, top_k)
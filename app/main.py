@@ -1,20 +1,32 @@
 # app/main.py
 
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
+import asyncio
 import httpx
 import json
 import traceback
 
 from app.models import EmbedRequest, BulkEmbedRequest, ChatRequest
-from app.embedding import process_pdf
-from app.chat import chat_with_gpt
-from app.bulk_embed import process_bulk_embedding
+from app.chat import achat_with_gpt, astream_chat_with_gpt
 from app.fetch_and_cache_products_from_crest_api import fetch_and_cache_products_from_crest_api
 from app.routers import product
 from app.db.database import Base, engine
+# Imported for its side effect: registers data_versions for create_all below
+from app.db.models.data_version import DataVersion  # noqa: F401
+from app.embedding_cache import embedding_cache
+from app.filter_cache import filter_cache
+from app.candidate_pruning import prompt_token_report
+from app.context_builder import context_report
+from app.answer_cache import answer_cache
+from app.search_clients import search_clients
+from app.chunk_registry import chunk_registry
+from app.job_queue import job_queue
+from app.job_worker import register_handlers, start_process, stop_process, JOB_WORKER_PROCESS
+from app.download_cache import download_cache
+from app.pdf_extract import parsed_text_cache
 
 # Create DB tables
 Base.metadata.create_all(bind=engine)
@@ -27,22 +39,88 @@ app = FastAPI(
 
 app.include_router(product.router)
 
+# Jobs run in a separate worker process (app/job_worker.py); the API only enqueues
+register_handlers(job_queue)
+job_worker_process = None
+
+@app.on_event("startup")
+def start_job_workers():
+    global job_worker_process
+    if JOB_WORKER_PROCESS:
+        job_worker_process = start_process()
+
+@app.on_event("shutdown")
+async def close_search_clients():
+    if job_worker_process is not None:
+        await asyncio.to_thread(stop_process, job_worker_process)
+    await search_clients.aclose()
+
 @app.get("/", tags=["Health"], summary="Health check")
 def root():
     return {"status": "Flooring AI backend is running"}
 
+@app.get("/cache-stats/", tags=["Health"], summary="Chat cache hit/miss statistics")
+def cache_stats():
+    return {
+        "embeddings": embedding_cache.stats(),
+        "filters": filter_cache.stats(),
+        "filter_prompt_tokens": prompt_token_report.stats(),
+        "prompt_context": context_report.stats(),
+        "answers": answer_cache.stats(),
+        "search_connections": search_clients.stats(),
+        "chunk_dedup": chunk_registry.stats(),
+        "downloads": download_cache.stats(),
+        "parsed_text": parsed_text_cache.stats(),
+    }
+
+# Ingestion runs on the background job queue; these return a job id at once
 @app.post("/embed/", tags=["Embeddings"], summary="Embed PDF brochure")
 def embed_pdf(request: EmbedRequest):
-    return process_pdf(request.file_path, request.index_name.value)
+    payload = {"file_path": request.file_path, "index_name": request.index_name.value, "force": request.force}
+    return {"job_id": job_queue.enqueue("embed", payload), "status": "queued"}
 
 @app.post("/bulk-embed/", tags=["Embeddings"], summary="Embed multiple brochures from Excel")
 def bulk_embed(request: BulkEmbedRequest):
-    return process_bulk_embedding(request.excel_url, request.index_name.value)
+    payload = {"excel_url": request.excel_url, "index_name": request.index_name.value, "force": request.force}
+    return {"job_id": job_queue.enqueue("bulk_embed", payload), "status": "queued"}
+
+@app.get("/jobs/", tags=["Embeddings"], summary="Recent embedding jobs")
+def list_jobs(limit: int = 50):
+    return job_queue.list(limit)
+
+@app.get("/jobs/{job_id}", tags=["Embeddings"], summary="Embedding job status and per-brochure progress")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel", tags=["Embeddings"], summary="Cancel an embedding job")
+def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+async def sse_chat_events(message, index_name):
+    # Server-Sent Events framing for astream_chat_with_gpt
+    try:
+        async for event in astream_chat_with_gpt(message, index_name):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    except Exception as e:
+        print(traceback.format_exc())
+        yield f"event: error\ndata: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
 
 @app.post("/chat/", tags=["Chat"], summary="Ask a flooring-related question")
 async def chat(request: ChatRequest):
+    if request.stream:
+        return StreamingResponse(
+            sse_chat_events(request.message, request.index_name.value),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
     try:
-        response = chat_with_gpt(request.message, request.index_name.value)
+        response = await achat_with_gpt(request.message, request.index_name.value)
         return {"reply": response}
     except Exception as e:
         print(traceback.format_exc())
@@ -61,6 +139,7 @@ def chat_ui():
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     while True:
+        streaming = False
         try:
             data = await websocket.receive_text()
             payload = json.loads(data)
@@ -73,12 +152,22 @@ async def websocket_endpoint(websocket: WebSocket):
                 await websocket.send_text("Error: 'message' and 'index_name' are required.")
                 continue
 
-            reply = chat_with_gpt(user_message, index_name)
+            # Streaming clients get JSON delta frames and a final "done" frame
+            streaming = bool(payload.get("stream"))
+            if streaming:
+                async for event in astream_chat_with_gpt(user_message, index_name):
+                    await websocket.send_text(json.dumps(event))
+                continue
+
+            reply = await achat_with_gpt(user_message, index_name)
             await websocket.send_text(reply)
 
         except Exception as e:
             print(f"[WebSocket] Error: {e}")
-            await websocket.send_text(f"Internal server error: {str(e)}")
+            if streaming:
+                await websocket.send_text(json.dumps({"type": "error", "message": f"Internal server error: {str(e)}"}))
+            else:
+                await websocket.send_text(f"Internal server error: {str(e)}")
             break
 
 @app.get("/fetch-products")
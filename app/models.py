@@ -11,11 +11,14 @@ class IndexName(str, Enum):
 class EmbedRequest(BaseModel):
     file_path: str
     index_name: IndexName
+    force: bool = False  # re-embed every chunk, ignoring the ingest manifest
 
 class BulkEmbedRequest(BaseModel):
     excel_url: str
     index_name: IndexName
+    force: bool = False
 
 class ChatRequest(BaseModel):
     message: str
-    index_name: IndexName
\ No newline at end of file
+    index_name: IndexName
+    stream: bool = False
\ No newline at end of file
@@ -0,0 +1,170 @@
+# app/pdf_extract.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pypdf
+from dotenv import load_dotenv
+load_dotenv()
+
+# Page-level PDF text extraction with a parsed-text cache.
+#
+# Large brochures are split into page ranges that are extracted in parallel
+# on a shared process pool. Inside the bulk pipeline's parse workers
+# (marked by extract_sequentially()) pages are extracted sequentially
+# instead: the brochures are already spread across cores there, and nested
+# pools would oversubscribe.
+# If a pool worker dies (OOM, segfault in a malformed PDF) the pool is broken
+# for good: it is dropped, the next call starts a fresh one, and the PDF
+# that hit it is extracted in-process.
+#
+# Extracted page text is cached by PDF content hash + extractor version, so
+# changing chunk settings or re-embedding never parses a PDF again. Bump
+# EXTRACTOR_REVISION when the extraction logic itself changes.
+
+PARSED_TEXT_CACHE_PATH = os.getenv("PARSED_TEXT_CACHE_PATH", "data/cache/parsed_text.sqlite3")
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Below this many pages, process start-up costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+
+EXTRACTOR_REVISION = 1
+EXTRACTOR_VERSION = f"pypdf-{pypdf.__version__}/{EXTRACTOR_REVISION}"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_text(page):
+    # Same text PyPDFLoader produced, so existing chunk hashes stay valid
+    return (page.extract_text() or "").strip()
+
+
+def extract_range(path, start, stop):
+    # Runs in a pool worker; opens its own reader
+    reader = pypdf.PdfReader(path)
+    return [page_text(reader.pages[i]) for i in range(start, stop)]
+
+
+def page_ranges(total, parts):
+    size = -(-total // parts)
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+class ParsedTextCache:
+    def __init__(self, path=PARSED_TEXT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed ("
+                "content_hash TEXT NOT NULL, extractor TEXT NOT NULL, pages TEXT NOT NULL, "
+                "page_labels TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (content_hash, extractor))"
+            )
+        return self._conn
+
+    def get(self, content_hash):
+        with self._lock:
+            row = self._db().execute(
+                "SELECT pages, page_labels FROM parsed WHERE content_hash = ? AND extractor = ?",
+                (content_hash, EXTRACTOR_VERSION),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0]), json.loads(row[1])
+
+    def put(self, content_hash, pages, labels):
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO parsed (content_hash, extractor, pages, page_labels, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, EXTRACTOR_VERSION, json.dumps(pages), json.dumps(labels), time.time()),
+            )
+            db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db().execute(
+                "SELECT COUNT(*) FROM parsed WHERE extractor = ?", (EXTRACTOR_VERSION,)
+            ).fetchone()[0]
+        return {"extractor": EXTRACTOR_VERSION, "entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+parsed_text_cache = ParsedTextCache()
+
+_pool = None
+_pool_lock = threading.Lock()
+_sequential = False
+
+
+def extract_sequentially():
+    # Process pool initializer for workers that already run one PDF per core
+    global _sequential
+    _sequential = True
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=context)
+        return _pool
+
+
+def shutdown_pool(pool=None):
+    # pool: only drop the pool if it is still this one (another thread may
+    # already have replaced a broken pool)
+    global _pool
+    with _pool_lock:
+        if _pool is not None and (pool is None or _pool is pool):
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def extract_pages(path):
+    # -> (page texts, page labels) for a local PDF
+    content_hash = file_hash(path)
+    cached = parsed_text_cache.get(content_hash)
+    if cached is not None:
+        return cached
+
+    reader = pypdf.PdfReader(path)
+    total = len(reader.pages)
+    labels = list(reader.page_labels)
+    if total < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_WORKERS < 2 or _sequential:
+        pages = [page_text(page) for page in reader.pages]
+    else:
+        pool = get_pool()
+        try:
+            futures = [pool.submit(extract_range, path, start, stop) for start, stop in page_ranges(total, PDF_EXTRACT_WORKERS)]
+            pages = [text for future in futures for text in future.result()]
+        except BrokenProcessPool as e:
+            print(f"[PDF extract] {path}: extraction pool broke ({e}); extracting in-process")
+            shutdown_pool(pool)
+            pages = [page_text(page) for page in reader.pages]
+
+    parsed_text_cache.put(content_hash, pages, labels)
+    return pages, labels
@@ -19,8 +19,8 @@ def list_products(db: Session = Depends(get_db)):
     return product_service.get_all_products(db)
 
 @router.post("/upload-excel", summary="Upload product Excel and upsert into DB")
-async def upload_excel(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_excel(file: UploadFile = File(...)):
     if not file.filename.endswith(".xlsx"):
         raise HTTPException(status_code=400, detail="Only .xlsx files are supported.")
-    result = await upsert_products_from_excel(file, db)
+    result = await upsert_products_from_excel(file)
     return result
\ No newline at end of file
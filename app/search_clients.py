@@ -0,0 +1,161 @@
+# app/search_clients.py
+
+import os
+import asyncio
+import threading
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport, AioHttpTransport
+from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from dotenv import load_dotenv
+load_dotenv()
+
+# Long-lived Azure Search clients, one per index, all sharing one HTTP
+# connection pool per flavour (sync: requests, async: aiohttp). Reusing the
+# pool keeps TCP/TLS sessions alive between chat messages instead of paying a
+# handshake per call.
+
+AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
+AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
+AZURE_SEARCH_POOL_SIZE = int(os.getenv("AZURE_SEARCH_POOL_SIZE", "20"))
+AZURE_SEARCH_CONNECT_TIMEOUT = float(os.getenv("AZURE_SEARCH_CONNECT_TIMEOUT", "5"))
+AZURE_SEARCH_READ_TIMEOUT = float(os.getenv("AZURE_SEARCH_READ_TIMEOUT", "30"))
+AZURE_SEARCH_KEEPALIVE = float(os.getenv("AZURE_SEARCH_KEEPALIVE", "60"))
+
+
+class SearchClientRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._credential = None
+        self._session = None
+        self._clients = {}
+        self._async_session = None
+        self._async_loop = None
+        self._async_clients = {}
+        self.clients_created = 0
+        self.async_connections_created = 0
+        self.async_connections_reused = 0
+
+    def _get_credential(self):
+        if self._credential is None:
+            self._credential = AzureKeyCredential(AZURE_SEARCH_KEY)
+        return self._credential
+
+    def _get_session(self):
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=AZURE_SEARCH_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def get(self, index_name):
+        client = self._clients.get(index_name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(index_name)
+            if client is None:
+                transport = RequestsTransport(
+                    session=self._get_session(),
+                    session_owner=False,
+                    connection_timeout=AZURE_SEARCH_CONNECT_TIMEOUT,
+                    read_timeout=AZURE_SEARCH_READ_TIMEOUT,
+                )
+                client = SearchClient(AZURE_SEARCH_ENDPOINT, index_name, self._get_credential(), transport=transport)
+                self._clients[index_name] = client
+                self.clients_created += 1
+            return client
+
+    def _get_async_session(self):
+        # aiohttp sessions are bound to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_loop is not loop:
+            async def on_create(session, ctx, params):
+                self.async_connections_created += 1
+
+            async def on_reuse(session, ctx, params):
+                self.async_connections_reused += 1
+
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(on_create)
+            trace.on_connection_reuseconn.append(on_reuse)
+            connector = aiohttp.TCPConnector(limit=AZURE_SEARCH_POOL_SIZE, keepalive_timeout=AZURE_SEARCH_KEEPALIVE)
+            self._async_session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+            self._async_loop = loop
+            self._async_clients = {}
+        return self._async_session
+
+    def get_async(self, index_name):
+        session = self._get_async_session()
+        client = self._async_clients.get(index_name)
+        if client is None:
+            transport = AioHttpTransport(
+                session=session,
+                session_owner=False,
+                connection_timeout=AZURE_SEARCH_CONNECT_TIMEOUT,
+                read_timeout=AZURE_SEARCH_READ_TIMEOUT,
+            )
+            client = AsyncSearchClient(AZURE_SEARCH_ENDPOINT, index_name, self._get_credential(), transport=transport)
+            self._async_clients[index_name] = client
+            self.clients_created += 1
+        return client
+
+    def stats(self):
+        # urllib3 pools count every connection they open and every request
+        # they send; the difference is requests served on a reused connection
+        connections = requests_sent = 0
+        if self._session is not None:
+            for adapter in self._session.adapters.values():
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                        requests_sent += pool.num_requests
+
+        async_requests = self.async_connections_created + self.async_connections_reused
+        return {
+            "clients": sorted(self._clients),
+            "async_clients": sorted(self._async_clients),
+            "clients_created": self.clients_created,
+            "pool_size": AZURE_SEARCH_POOL_SIZE,
+            "sync": {
+                "connections_opened": connections,
+                "requests": requests_sent,
+                "reuse_rate": round(1 - connections / requests_sent, 4) if requests_sent else 0.0,
+            },
+            "async": {
+                "connections_opened": self.async_connections_created,
+                "connections_reused": self.async_connections_reused,
+                "reuse_rate": round(self.async_connections_reused / async_requests, 4) if async_requests else 0.0,
+            },
+        }
+
+    async def aclose(self):
+        for client in list(self._async_clients.values()):
+            await client.close()
+        self._async_clients = {}
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+        for client in list(self._clients.values()):
+            client.close()
+        self._clients = {}
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+search_clients = SearchClientRegistry()
+
+
+def get_search_client(index_name):
+    return search_clients.get(index_name)
+
+
+def get_async_search_client(index_name):
+    return search_clients.get_async(index_name)
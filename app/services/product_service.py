@@ -1,10 +1,22 @@
 # app/services/product_service.py
 
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from io import BytesIO
+from openpyxl import load_workbook
+from sqlalchemy import select, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from app.db.database import SessionLocal
 from app.db.models.product import Product
+from app.db.data_version import bump_product_version
 from app.schemas.product import ProductSchema
+from app.answer_cache import answer_cache
 from sqlalchemy import Column, Integer, String, Float, Text
 
 EXCLUDED_COLUMNS = [
@@ -30,68 +42,152 @@ EXCLUDED_COLUMNS = [
     'SalesSheet', 'SDS'
 ]
 
+# /products/upload-excel streams the sheet: rows are read, cleaned and
+# upserted this many at a time, one transaction per chunk
+PRODUCT_UPSERT_CHUNK_ROWS = int(os.getenv("PRODUCT_UPSERT_CHUNK_ROWS", "1000"))
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# Dialects with INSERT ... ON CONFLICT; others fall back to bulk UPDATE by id
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
 def create_product(db: Session, product_data: ProductSchema):
     db_product = Product(**product_data.dict())
     db.add(db_product)
+    bump_product_version(db)
     db.commit()
     db.refresh(db_product)
+    answer_cache.invalidate()
     return db_product
 
 def get_all_products(db: Session):
     return db.query(Product).all()
 
-def safe_cast(value, dtype):
-    try:
-        return dtype(value)
-    except (ValueError, TypeError):
-        return None
-
-async def upsert_products_from_excel(file, db: Session):
-    content = await file.read()
-    df = pd.read_excel(BytesIO(content), dtype=str)
-    df = df.where(pd.notnull(df), None) 
-
-    # Step 1: Drop excluded columns
-    df = df.drop(columns=[col for col in EXCLUDED_COLUMNS if col in df.columns])
-
-    # Step 2: Normalize column names
-    df.columns = [col.strip().lower().replace(" ", "_") for col in df.columns]
-
-    # Step 3: Deduplicate columns (remove .1, .2 suffixes)
-    seen = set()
-    cleaned_columns, drop_indices = [], []
-    for i, col in enumerate(df.columns):
-        base_col = col.split(".")[0]
-        if base_col not in seen:
-            cleaned_columns.append(base_col)
-            seen.add(base_col)
-        else:
-            drop_indices.append(i)
-    df = df.drop(df.columns[drop_indices], axis=1)
-    df.columns = cleaned_columns
+def plan_columns(header):
+    # Sheet column positions to keep and their model column names:
+    # excluded columns dropped, names normalized, repeated names (and names
+    # the model does not have) ignored
+    table = Product.__table__
+    positions, names, ignored = [], [], []
+    for i, raw in enumerate(header):
+        if raw is None or str(raw) in EXCLUDED_COLUMNS:
+            continue
+        name = str(raw).strip().lower().replace(" ", "_").split(".")[0]
+        if name in names:
+            continue
+        if name not in table.columns or name == "id":
+            ignored.append(name)
+            continue
+        positions.append(i)
+        names.append(name)
+    return positions, names, ignored
 
-    inserted, updated = 0, 0
-    float_columns = [c.name for c in Product.__table__.columns if isinstance(c.type, Float)]
+def clean_chunk(rows, positions, names, float_columns):
+    # Vectorized per chunk: values as strings, float columns coerced, NaN -> None
+    df = pd.DataFrame([[row[i] if i < len(row) else None for i in positions] for row in rows], columns=names, dtype=object)
+    missing = df.isna()
+    df = df.astype(str).mask(missing, None)
+    for col in float_columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    df = df.astype(object).where(df.notna(), None)
 
-    for row in df.to_dict(orient="records"):
-        # print(f'Row ==> {row}')
-        for col in float_columns:
-            row[col] = safe_cast(row.get(col), float) if pd.notnull(row.get(col)) else None
+    # Last row wins when a SKU repeats
+    df = df[df["sku"].notna() & (df["sku"] != "")]
+    return df.drop_duplicates("sku", keep="last").to_dict(orient="records")
 
-        sku = row.get("sku")
-        if not sku:
-            continue
+def iter_sheet_chunks(path, chunk_rows=PRODUCT_UPSERT_CHUNK_ROWS):
+    # Streams the first sheet with openpyxl's read-only reader
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield header
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
 
-        existing = db.query(Product).filter(Product.sku == sku).first()
-        if existing:
-            for key, value in row.items():
-                setattr(existing, key, value)
-            updated += 1
+def upsert_chunk(db: Session, rows, upsert):
+    # SKUs of this chunk already stored (lowest id when a SKU repeats); rows
+    # inserted by earlier chunks are found here too
+    skus = [row["sku"] for row in rows]
+    existing = dict(db.execute(
+        select(Product.sku, func.min(Product.id)).where(Product.sku.in_(skus)).group_by(Product.sku)
+    ).all())
+    new_rows = [row for row in rows if row["sku"] not in existing]
+    updated_rows = [{"id": existing[row["sku"]], **row} for row in rows if row["sku"] in existing]
+    if new_rows:
+        db.execute(insert(Product.__table__), new_rows)
+    if updated_rows:
+        db.execute(upsert, updated_rows)
+    bump_product_version(db)
+    db.commit()
+    return len(new_rows), len(updated_rows)
+
+def import_products_excel(path):
+    # Runs in a worker process with its own DB session; memory is bounded by
+    # PRODUCT_UPSERT_CHUNK_ROWS, not by the size of the sheet
+    started = time.perf_counter()
+    table = Product.__table__
+    float_columns = [c.name for c in table.columns if isinstance(c.type, Float)]
+    chunks = iter_sheet_chunks(path)
+    header = next(chunks, None)
+    if header is None:
+        return {"inserted": 0, "updated": 0, "total": 0, "ignored_columns": [], "elapsed_s": 0.0, "rows_per_second": 0.0}
+    positions, names, ignored_columns = plan_columns(header)
+
+    inserted = updated = 0
+    with SessionLocal() as db:
+        dialect_insert = UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+        if dialect_insert is not None:
+            upsert = dialect_insert(table)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={col: upsert.excluded[col] for col in names},
+            )
         else:
-            product = Product(**row)
-            # print(f'product ==> {product.__dict__}')
-            db.add(product)
-            inserted += 1
+            upsert = update(Product)
 
-    db.commit()
-    return {"inserted": inserted, "updated": updated, "total": inserted + updated}
\ No newline at end of file
+        if "sku" in names:
+            for chunk in chunks:
+                rows = clean_chunk(chunk, positions, names, float_columns)
+                if rows:
+                    new, changed = upsert_chunk(db, rows, upsert)
+                    inserted += new
+                    updated += changed
+
+    elapsed = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "total": inserted + updated,
+        "ignored_columns": ignored_columns,
+        "elapsed_s": round(elapsed, 2),
+        "rows_per_second": round((inserted + updated) / elapsed, 1) if elapsed else 0.0,
+    }
+
+async def upsert_products_from_excel(file):
+    # Spool the upload to disk, then parse and upsert in a worker process so
+    # the event loop (chat sockets) never waits on it
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, spool, SPOOL_CHUNK_BYTES)
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = await loop.run_in_executor(pool, import_products_excel, path)
+    finally:
+        os.remove(path)
+
+    # Cached answers may quote rows that just changed
+    answer_cache.invalidate()
+    return result
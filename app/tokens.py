@@ -0,0 +1,34 @@
+# app/tokens.py
+
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+load_dotenv()
+
+# Token counting for prompt budgeting. Uses tiktoken when it is installed and
+# falls back to a ~4 characters per token estimate otherwise.
+#
+# Chat models (gpt-4o) tokenize with o200k_base; the text-embedding-3 models
+# still use cl100k_base, so embedding batch limits are counted with that.
+
+TIKTOKEN_ENCODING = os.getenv("TIKTOKEN_ENCODING", "o200k_base")
+EMBEDDING_TOKEN_ENCODING = os.getenv("EMBEDDING_TOKEN_ENCODING", "cl100k_base")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name=TIKTOKEN_ENCODING):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"[!] tiktoken encoding {name} unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text, encoding_name=TIKTOKEN_ENCODING):
+    if not text:
+        return 0
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
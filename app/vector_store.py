@@ -0,0 +1,190 @@
+# app/vector_store.py
+
+import os
+import json
+import time
+import asyncio
+import threading
+from app.azure_search import upload_search_documents, delete_search_documents
+from app.azure_search import search_similar_documents, asearch_similar_documents
+from app.azure_search import hybrid_search_documents, ahybrid_search_documents
+from app.local_vector_index import LocalVectorIndex
+from azure.search.documents.models import VectorizedQuery
+from app.batching import BatchResult, BatchReport
+from app.hybrid_search import SEARCH_MODE, HYBRID_CANDIDATES, HYBRID_VECTOR_WEIGHT, HYBRID_KEYWORD_WEIGHT, fuse_hits
+from dotenv import load_dotenv
+load_dotenv()
+
+# Backend-neutral entry points for brochure chunk storage and retrieval.
+# VECTOR_STORE_BACKEND selects where chunks live:
+#   azure - Azure Cognitive Search (default)
+#   local - in-process NumPy index persisted under LOCAL_VECTOR_STORE_DIR,
+#           for offline runs/benchmarks; LOCAL_VECTOR_ANN=1 switches exact
+#           search to the approximate neighbor graph
+# With SEARCH_MODE=hybrid and a query text, the vector ranking is fused with
+# a BM25 keyword ranking: azure does it server side in the same request,
+# local runs BM25Index next to the vector query and fuses them with
+# fuse_hits. HYBRID_VECTOR_WEIGHT / HYBRID_KEYWORD_WEIGHT apply to both:
+# azure weighs its vector query relative to the text query (weight 1), so
+# it gets their ratio.
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "azure")
+LOCAL_VECTOR_STORE_DIR = os.getenv("LOCAL_VECTOR_STORE_DIR", "data/vector_store")
+LOCAL_VECTOR_ANN = os.getenv("LOCAL_VECTOR_ANN", "0") == "1"
+
+
+def iter_documents(index_name, pdf_name, texts, vectors, metadata, ids=None):
+    # Lazily, so an upload only holds the batches in flight as JSON-ready lists
+    for i in range(len(texts)):
+        yield {
+            "id": ids[i] if ids else f"{pdf_name}-{i}",
+            "content": texts[i],
+            "embedding": vectors[i].tolist(),
+            "metadata": json.dumps(metadata[i]) if i < len(metadata) else "{}",
+            "surface_type": metadata[i].get("surface_type", index_name),
+            "collection_name": metadata[i].get("collection_name", ""),
+            "product_type": metadata[i].get("product_type", "")
+        }
+
+
+class AzureVectorStore:
+    name = "azure"
+
+    def upsert(self, index_name, documents):
+        return upload_search_documents(index_name, documents)
+
+    def delete(self, index_name, ids):
+        return len(delete_search_documents(index_name, ids))
+
+    def search(self, query_vector, index_name, top_k=10):
+        return search_similar_documents(query_vector, index_name, top_k=top_k)
+
+    async def asearch(self, query_vector, index_name, top_k=10):
+        return await asearch_similar_documents(query_vector, index_name, top_k=top_k)
+
+    def hybrid_search(self, query_text, query_vector, index_name, top_k=10):
+        return hybrid_search_documents(query_text, query_vector, index_name, top_k=top_k)
+
+    async def ahybrid_search(self, query_text, query_vector, index_name, top_k=10):
+        return await ahybrid_search_documents(query_text, query_vector, index_name, top_k=top_k)
+
+
+class LocalVectorStore:
+    name = "local"
+
+    def __init__(self, root=LOCAL_VECTOR_STORE_DIR, ann=LOCAL_VECTOR_ANN):
+        self.root = root
+        self.ann = ann
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get_index(self, index_name):
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is None:
+                index = LocalVectorIndex(os.path.join(self.root, index_name), ann=self.ann)
+                self._indexes[index_name] = index
+            return index
+
+    def upsert(self, index_name, documents):
+        # One in-process "batch"; same report shape as the azure upload
+        documents = list(documents)
+        report = BatchReport()
+        result = BatchResult(0, len(documents), 0)
+        started = time.perf_counter()
+        index = self.get_index(index_name)
+        result.attempts = 1
+        result.succeeded = index.upsert(documents)
+        index.save()
+        result.duration_ms = report.elapsed_ms = (time.perf_counter() - started) * 1000
+        report.add(result)
+        print(f"Upserted {result.succeeded} documents into local vector index '{index_name}'.")
+        return report
+
+    def delete(self, index_name, ids):
+        index = self.get_index(index_name)
+        removed = index.delete(ids)
+        if removed:
+            index.save()
+        return removed
+
+    def search(self, query_vector, index_name, top_k=10):
+        # query_vector is the same VectorizedQuery the Azure backend receives
+        return self.get_index(index_name).query(query_vector.vector, top_k=top_k)
+
+    def keyword_search(self, query_text, index_name, top_k=10):
+        return self.get_index(index_name).keyword_search(query_text, top_k=top_k)
+
+    # Off the event loop: a query waits on the index lock while save(),
+    # _load or a lazy BM25 / graph build holds it
+    async def asearch(self, query_vector, index_name, top_k=10):
+        return await asyncio.to_thread(self.search, query_vector, index_name, top_k)
+
+    def hybrid_search(self, query_text, query_vector, index_name, top_k=10):
+        depth = max(top_k, HYBRID_CANDIDATES)
+        vector_hits = self.search(query_vector, index_name, top_k=depth)
+        keyword_hits = self.keyword_search(query_text, index_name, top_k=depth)
+        return fuse_hits(vector_hits, keyword_hits, top_k)
+
+    async def ahybrid_search(self, query_text, query_vector, index_name, top_k=10):
+        return await asyncio.to_thread(self.hybrid_search, query_text, query_vector, index_name, top_k)
+
+
+VECTOR_STORES = {
+    "azure": AzureVectorStore,
+    "local": LocalVectorStore,
+}
+
+_vector_store = None
+
+
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        backend = VECTOR_STORES.get(VECTOR_STORE_BACKEND)
+        if backend is None:
+            raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{VECTOR_STORE_BACKEND}'")
+        _vector_store = backend()
+    return _vector_store
+
+
+# === Upload Embeddings ===
+def upload_documents_to_search(index_name, pdf_name, texts, vectors, metadata, ids=None):
+    # -> BatchReport with one entry per batch
+    documents = iter_documents(index_name, pdf_name, texts, vectors, metadata, ids)
+    return get_vector_store().upsert(index_name, documents)
+
+
+def delete_documents_from_search(index_name, ids):
+    return get_vector_store().delete(index_name, ids)
+
+
+# === Vector / Hybrid Search ===
+def with_k(query_vector, k, weight=None):
+    # The vector query's k follows the requested depth instead of whatever
+    # the caller built it with
+    return VectorizedQuery(
+        vector=query_vector.vector, k_nearest_neighbors=k, fields=query_vector.fields,
+        exhaustive=query_vector.exhaustive, weight=weight,
+    )
+
+
+def hybrid_vector_query(query_vector, top_k):
+    weight = HYBRID_VECTOR_WEIGHT / HYBRID_KEYWORD_WEIGHT if HYBRID_KEYWORD_WEIGHT else None
+    return with_k(query_vector, max(top_k, HYBRID_CANDIDATES), weight)
+
+
+def search_similar_content(query_vector, index_name, top_k=10, query_text=None):
+    store = get_vector_store()
+    if SEARCH_MODE != "hybrid" or not query_text:
+        return [hit["content"] for hit in store.search(with_k(query_vector, top_k), index_name, top_k=top_k)]
+    query_vector = hybrid_vector_query(query_vector, top_k)
+    return [hit["content"] for hit in store.hybrid_search(query_text, query_vector, index_name, top_k=top_k)]
+
+
+async def asearch_similar_content(query_vector, index_name, top_k=10, query_text=None):
+    store = get_vector_store()
+    if SEARCH_MODE != "hybrid" or not query_text:
+        return [hit["content"] for hit in await store.asearch(with_k(query_vector, top_k), index_name, top_k=top_k)]
+    query_vector = hybrid_vector_query(query_vector, top_k)
+    return [hit["content"] for hit in await store.ahybrid_search(query_text, query_vector, index_name, top_k=top_k)]
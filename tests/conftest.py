@@ -0,0 +1,14 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# app modules build their clients at import; give them placeholder settings
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://test.openai.azure.com")
+os.environ.setdefault("AZURE_OPENAI_EMBEDDING_API_VERSION", "2024-02-01")
+os.environ.setdefault("AZURE_SEARCH_ENDPOINT", "https://test.search.windows.net")
+os.environ.setdefault("AZURE_SEARCH_KEY", "test")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
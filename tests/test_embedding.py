@@ -0,0 +1,55 @@
+# tests/test_embedding.py
+
+import pytest
+from app import embedding
+from app.batching import BatchReport
+from app.chunk_registry import ChunkRegistry
+from app.ingest_manifest import IngestManifest
+
+
+class FakeBatcher:
+    # Embeds every text except the ones in `rejected` (as a 400 would leave them)
+    rejected = set()
+
+    def __init__(self, client, model):
+        pass
+
+    def embed(self, texts):
+        vectors = [None if text in self.rejected else [0.1] * embedding.EMBEDDING_DIM for text in texts]
+        return vectors, BatchReport()
+
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch):
+    stored = {}
+    monkeypatch.setattr(embedding, "chunk_registry", ChunkRegistry(str(tmp_path / "registry.sqlite3")))
+    monkeypatch.setattr(embedding, "ingest_manifest", IngestManifest(str(tmp_path / "manifest.sqlite3")))
+    monkeypatch.setattr(embedding, "EmbeddingBatcher", FakeBatcher)
+    monkeypatch.setattr(
+        embedding, "upload_documents_to_search",
+        lambda index_name, pdf_name, texts, vectors, metadata, ids: stored.update(zip(ids, texts)) or BatchReport(),
+    )
+    monkeypatch.setattr(embedding, "delete_documents_from_search", lambda index_name, ids: len(ids))
+
+    def run(texts):
+        job = embedding.IngestJob("c.pdf", "idx", "c", texts, [{} for _ in texts])
+        return embedding.plan_job(job) or embedding.embed_job(job) or embedding.upload_job(job)
+
+    run.stored = stored
+    return run
+
+
+def test_failed_chunk_and_its_repeats_are_retried(ingest, monkeypatch):
+    x, y = "x " * 50, "y " * 50
+    monkeypatch.setattr(FakeBatcher, "rejected", {x})
+    first = ingest([x, y, x])
+    assert first["status"] == "partial"
+    assert first["failed"] == 2
+    assert set(ingest.stored.values()) == {y}
+
+    monkeypatch.setattr(FakeBatcher, "rejected", set())
+    second = ingest([x, y, x])
+    assert second["status"] == "embedded"
+    assert second["chunks"] == 1
+    assert second["duplicates"] == 1
+    assert set(ingest.stored.values()) == {x, y}